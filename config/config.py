@@ -44,6 +44,31 @@ class Config:
     # how many results to display in d!search
     SEARCH_RESULTS = 5
 
+    # number of processes extracting song info
+    # 0 means choose automatically based on CPU count
+    LOADER_PROCESSES = 0
+    # how many extractions of the same site can run at once in each process
+    # keys are yt-dlp extractor modules, other sites get 1
+    SITE_CONCURRENCY = {"youtube": 3}
+    # how many preloads of one guild can run at once
+    # so that a huge queue in one guild doesn't stall the others
+    MAX_GUILD_JOBS = 2
+    # how many playlists of one guild can load at once
+    MAX_GUILD_STREAMS = 1
+    # seconds to wait for song info before giving up, 0 to wait forever
+    LOAD_TIMEOUT = 60
+    # send a copy of extractions that take longer than usual
+    # to another process, and use whichever finishes first
+    HEDGE_EXTRACTIONS = False
+    # video that each loader process extracts before taking requests
+    # so that the first song doesn't wait for yt-dlp to get ready
+    WARMUP_URL = ""
+    # restart a loader process after it ran this many jobs, 0 to disable
+    LOADER_MAX_JOBS = 1000
+    # restart a loader process when it uses more memory than this (in MB)
+    # only checked on Linux, 0 to disable
+    LOADER_MAX_MEMORY = 500
+
     MAX_HISTORY_LENGTH = 10
     MAX_TRACKNAME_HISTORY_LENGTH = 15
 
@@ -70,6 +95,9 @@ class Config:
     )
 
     COOKIE_PATH = "config/cookies/cookies.txt"
+    # directory with a cookies file (*.txt) for each account
+    # requests are spread between them, COOKIE_PATH is used if it's empty
+    COOKIE_DIR = "config/cookies/accounts"
 
     GLOBAL_DISABLE_AUTOJOIN_VC = False
 
@@ -122,6 +150,11 @@ class Config:
             if os.path.isfile(path):
                 self.COOKIE_PATH = path
                 break
+        for dir_ in CONFIG_DIRS[::-1]:
+            path = os.path.join(dir_, self.COOKIE_DIR)
+            if os.path.isdir(path):
+                self.COOKIE_DIR = path
+                break
 
         data = join_dicts(
             load_configs(
@@ -246,6 +279,7 @@ class Config:
         # List of internal variables that shouldn't be tracked
         internal_vars = [
             'COOKIE_PATH',  # Don't track COOKIE_PATH as it can change based on runtime path
+            'COOKIE_DIR',   # Same as COOKIE_PATH
             'DATABASE',     # Internal database connection string
             'DATABASE_LIBRARY',  # Internal database library
             'DATABASE_LIBRARY_NAME',  # Internal database library name
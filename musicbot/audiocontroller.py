@@ -1,17 +1,30 @@
 import os
 import sys
 import asyncio
-from itertools import islice
 from inspect import isawaitable
-from traceback import print_exc
-from typing import TYPE_CHECKING, Coroutine, Literal, Optional, Union
+from traceback import print_exc, print_exception
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Coroutine,
+    List,
+    Literal,
+    Optional,
+    Union,
+)
 
 import discord
 from config import config
 
 from musicbot import loader, utils
 from musicbot.song import Song
-from musicbot.playlist import Playlist, LoopMode, LoopState, PauseState
+from musicbot.playlist import (
+    Playlist,
+    PlaylistCursor,
+    LoopMode,
+    LoopState,
+    PauseState,
+)
 from musicbot.utils import CheckError, asset, play_check, dj_check
 from pathlib import Path
 import pickle
@@ -93,6 +106,8 @@ class AudioController(object):
         # according to Python documentation, we need
         # to keep strong references to all tasks
         self._tasks = set()
+        # tasks adding the rest of playlists to the queue
+        self._playlist_loaders = set()
 
         self.message_lock = asyncio.Lock()
 
@@ -351,7 +366,9 @@ class AudioController(object):
     async def play_song(self, song: Song):
         """Plays a song object"""
 
-        if not await loader.preload(song, self.bot):
+        if not await loader.preload(
+            song, self.bot, loader.Priority.PLAYBACK, self.guild.id
+        ):
             self.next_song(forced=True)
             return
 
@@ -396,9 +413,13 @@ class AudioController(object):
         self, track: str
     ) -> Union[Optional[Song], Literal[PLAYLIST]]:
         """Adds the track to the playlist instance
-        Starts playing if it is the first song"""
+        Starts playing if it is the first song
+
+        Playlists are added in batches as they load,
+        playback starts after the first one"""
 
-        loaded_song = await loader.load_song(track)
+        stream = loader.load_song_stream(track, guild=self.guild.id)
+        loaded_song = await anext(stream, None)
         if not loaded_song:
             return None
         elif isinstance(loaded_song, Song):
@@ -406,11 +427,12 @@ class AudioController(object):
         else:
             for song in loaded_song:
                 self.playlist.add(song)
-            if len(loaded_song) == 1:
-                # special-case one-item playlists
-                loaded_song = loaded_song[0]
-            else:
-                loaded_song = PLAYLIST
+            task = self.add_task(
+                self._load_playlist_rest(track, stream, len(loaded_song))
+            )
+            self._playlist_loaders.add(task)
+            task.add_done_callback(self._playlist_loaders.discard)
+            loaded_song = PLAYLIST
 
         self.pickle_playlist()
         if self.current_song is None:
@@ -421,17 +443,113 @@ class AudioController(object):
 
         return loaded_song
 
-    def add_task(self, coro: Coroutine):
+    async def process_songs(self, tracks: List[str]):
+        """Adds several tracks to the playlist, loading them at once
+        Tracks are queued in the given order as soon as they are loaded
+
+        Playlists are streamed like in process_song,
+        tracks that failed to load are reported to the command channel"""
+
+        start = 0
+        for end, track in enumerate(tracks):
+            if loader.may_be_playlist(track):
+                await self._process_batch(tracks[start:end])
+                start = end + 1
+                try:
+                    if await self.process_song(track) is None:
+                        await self._report_failure(track, None)
+                except (loader.SongError, loader.WorkerError) as e:
+                    await self._report_failure(track, e)
+        await self._process_batch(tracks[start:])
+
+    async def _process_batch(self, tracks: List[str]):
+        if not tracks:
+            return
+        loaded = {}
+        queued = 0
+        async for i, result in loader.load_songs(tracks, guild=self.guild.id):
+            loaded[i] = result
+            while queued in loaded:
+                result = loaded.pop(queued)
+                queued += 1
+                if isinstance(result, Song):
+                    self.playlist.add(result)
+                elif isinstance(result, list) and result:
+                    self.playlist.add(result[0])
+                    self.playlist.add(PlaylistCursor.from_songs(result[1:]))
+                else:
+                    await self._report_failure(tracks[queued - 1], result)
+                    continue
+                if self.current_song is None:
+                    await self.play_song(self.playlist[0])
+
+        self.pickle_playlist()
+        self.preload_queue()
+
+    async def _report_failure(
+        self, track: str, error: Union[None, list, Exception]
+    ):
+        if isinstance(error, loader.SongError):
+            text = str(error)
+        elif isinstance(error, Exception):
+            print_exception(error, file=sys.stderr)
+            text = config.SONGINFO_ERROR
+        else:
+            # nothing found, or an empty playlist
+            text = config.SONGINFO_UNSUPPORTED
+        await self._report_progress(None, f"<{track}> {text}")
+
+    async def _load_playlist_rest(
+        self, track: str, stream: AsyncIterator[List[Song]], count: int
+    ):
+        message = None
+        try:
+            async for batch in stream:
+                self.playlist.add(PlaylistCursor.from_songs(batch))
+                if count < config.MAX_SONG_PRELOAD:
+                    self.preload_queue()
+                count += len(batch)
+                message = await self._report_progress(
+                    message, config.PLAYLIST_LOADING.format(count=count)
+                )
+        except (loader.SongError, loader.WorkerError) as e:
+            # songs loaded so far stay in queue
+            await self._report_failure(track, e)
+            return
+        finally:
+            self.pickle_playlist()
+        await self._report_progress(
+            message, config.PLAYLIST_LOADED.format(count=count)
+        )
+
+    async def _report_progress(
+        self, message: Optional[discord.Message], text: str
+    ) -> Optional[discord.Message]:
+        if not self.command_channel:
+            return None
+        try:
+            if message is None:
+                return await self.command_channel.send(text)
+            await message.edit(content=text)
+        except discord.HTTPException:
+            print_exc(file=sys.stderr)
+        return message
+
+    def add_task(self, coro: Coroutine) -> asyncio.Task:
         task = self.bot.loop.create_task(coro)
         self._tasks.add(task)
         task.add_done_callback(self._tasks.remove)
+        return task
 
     async def _preload_queue(self):
         rerun_needed = False
-        for song in list(
-            islice(self.playlist.playque, 1, config.MAX_SONG_PRELOAD)
+        async for song, success in loader.preload_songs(
+            self.playlist.head(config.MAX_SONG_PRELOAD)[1:],
+            self.bot,
+            guild=self.guild.id,
         ):
-            if not await loader.preload(song, self.bot):
+            # songs that may load later stay in queue
+            if success is False:
                 try:
                     self.playlist.playque.remove(song)
                     rerun_needed = True
@@ -448,6 +566,8 @@ class AudioController(object):
     def stop_player(self):
         """Stops the player and removes all songs from the queue"""
         self._stopping = True
+        for task in self._playlist_loaders:
+            task.cancel()
         self.pickle_playlist()
         self.playlist.loop = LoopMode.OFF
         self.playlist.clear()
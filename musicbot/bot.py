@@ -60,6 +60,11 @@ class MusicBot(commands.Bot):
         await extract_legacy_settings(self)
         await migrate_old_playlists(self)
 
+        # avoiding circular import
+        from musicbot import loader
+
+        await loader.init(self)
+
         return await super().start(*args, **kwargs)
 
     async def close(self):
@@ -72,6 +77,9 @@ class MusicBot(commands.Bot):
                 for audiocontroller in self.audio_controllers.values()
             )
         )
+        from musicbot import loader
+
+        await loader.close()
         return await super().close()
 
     async def on_ready(self):
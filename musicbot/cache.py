@@ -0,0 +1,314 @@
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from copy import deepcopy
+from traceback import print_exception
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Hashable, Mapping, NamedTuple, Optional
+
+
+CACHE_FILE = Path("backup") / "cache.db"
+
+
+class _Database:
+    """Lazily opened SQLite file shared by all caches
+
+    It's only used from its own thread, so queries don't block
+    the event loop and writes are done in the order they were made"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._connection = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="cache")
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # with WAL, only a power loss can lose the last writes
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        return self._connection
+
+    async def query(self, f, *args):
+        """Returns `f(*args)` called in the database thread"""
+        return await asyncio.wrap_future(self._executor.submit(f, *args))
+
+    def write(self, f, *args):
+        """Calls `f(*args)` in the database thread without waiting for it,
+        queries made afterwards see what it wrote"""
+        self._executor.submit(f, *args).add_done_callback(_print_error)
+
+
+def _print_error(future: Future):
+    error = future.exception()
+    if error is not None:
+        print_exception(error, file=sys.stderr)
+
+
+_database = _Database(CACHE_FILE)
+
+
+class TTLCache:
+    """In-memory LRU cache with entries expiring after `ttl` seconds
+
+    Values are copied on the way in and out,
+    so callers are free to modify them"""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            try:
+                expire, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expire <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+        return deepcopy(value)
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Stores the value for `ttl` seconds, or the default TTL if None"""
+        value = deepcopy(value)
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+class ExtractionCache:
+    """Stores song info by canonical URL until its stream URL expires"""
+
+    # how many writes to do before removing expired entries
+    PURGE_INTERVAL = 100
+
+    def __init__(self, database: _Database = _database):
+        self._database = database
+        self._created = False
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        db = self._database.connection
+        if not self._created:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS extractions"
+                " (key TEXT PRIMARY KEY, data TEXT, expire INTEGER)"
+            )
+            self._created = True
+        return db
+
+    async def get(self, key: str, valid_for: int = 0) -> Optional[dict]:
+        """Returns cached info if it won't expire in `valid_for` seconds"""
+        return await self._database.query(self._get, key, valid_for)
+
+    def _get(self, key: str, valid_for: int) -> Optional[dict]:
+        row = self._db.execute(
+            "SELECT data FROM extractions WHERE key = ? AND expire > ?",
+            (key, int(time.time()) + valid_for),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, data: dict, expire: int):
+        self._database.write(self._put, key, data, expire)
+
+    def _put(self, key: str, data: dict, expire: int):
+        self._db.execute(
+            "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?)",
+            (key, json.dumps(data), expire),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_INTERVAL == 0:
+            self._db.execute(
+                "DELETE FROM extractions WHERE expire <= ?",
+                (int(time.time()),),
+            )
+
+
+class SpotifyMapping:
+    """Remembers which YouTube video plays each Spotify song
+
+    Songs are stored by Spotify ID together with their ISRC if known,
+    so other releases of the same recording map to the same video"""
+
+    # older entries are searched again when used
+    MAX_AGE = 30 * 24 * 60 * 60
+
+    def __init__(self, database: _Database = _database):
+        self._database = database
+        self._created = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        db = self._database.connection
+        if not self._created:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS spotify_songs"
+                " (id TEXT PRIMARY KEY, isrc TEXT,"
+                " webpage_url TEXT, updated INTEGER)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS spotify_songs_isrc"
+                " ON spotify_songs (isrc)"
+            )
+            self._created = True
+        return db
+
+    def _find(self, column: str, value: str) -> Optional[str]:
+        row = self._db.execute(
+            f"SELECT webpage_url FROM spotify_songs"
+            f" WHERE {column} = ? AND updated > ?",
+            (value, int(time.time()) - self.MAX_AGE),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    async def get(self, spotify_id: str) -> Optional[str]:
+        return await self._database.query(self._find, "id", spotify_id)
+
+    async def get_by_isrc(self, isrc: str) -> Optional[str]:
+        return await self._database.query(self._find, "isrc", isrc)
+
+    def put(self, spotify_id: str, isrc: Optional[str], webpage_url: str):
+        self._database.write(
+            self._execute,
+            "INSERT OR REPLACE INTO spotify_songs VALUES (?, ?, ?, ?)",
+            (spotify_id, isrc, webpage_url, int(time.time())),
+        )
+
+    def forget(self, webpage_url: str):
+        """Removes all songs mapped to the video, e.g. if it was deleted"""
+        self._database.write(
+            self._execute,
+            "DELETE FROM spotify_songs WHERE webpage_url = ?",
+            (webpage_url,),
+        )
+
+    def _execute(self, sql: str, parameters: tuple):
+        self._db.execute(sql, parameters)
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    charset: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    # until when it can be used without asking the server
+    expire: int
+
+    @property
+    def fresh(self) -> bool:
+        return self.expire > time.time()
+
+
+def response_expire(headers: Mapping[str, str]) -> Optional[int]:
+    """Returns until when a response is fresh according to its headers,
+    or None if it must not be stored"""
+    directives = {}
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    now = int(time.time())
+    if "no-cache" in directives:
+        return now
+    for name in ("s-maxage", "max-age"):
+        try:
+            return now + int(directives[name])
+        except (KeyError, ValueError):
+            pass
+    try:
+        return int(parsedate_to_datetime(headers["Expires"]).timestamp())
+    except (KeyError, TypeError, ValueError):
+        return now
+
+
+class HTTPCache:
+    """Stores responses of web pages for revalidating
+    with ETag and Last-Modified, or reusing while they are fresh"""
+
+    # how many writes to do before removing old entries
+    PURGE_INTERVAL = 100
+    # entries not stored again for this long are removed
+    MAX_AGE = 7 * 24 * 60 * 60
+
+    def __init__(self, database: _Database = _database):
+        self._database = database
+        self._created = False
+        self._writes = 0
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        db = self._database.connection
+        if not self._created:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS http_responses"
+                " (url TEXT PRIMARY KEY, body BLOB, charset TEXT, etag TEXT,"
+                " last_modified TEXT, expire INTEGER, stored INTEGER)"
+            )
+            self._created = True
+        return db
+
+    async def get(self, url: str) -> Optional[CachedResponse]:
+        return await self._database.query(self._get, url)
+
+    def _get(self, url: str) -> Optional[CachedResponse]:
+        row = self._db.execute(
+            "SELECT body, charset, etag, last_modified, expire"
+            " FROM http_responses WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        return CachedResponse(*row)
+
+    def put(self, url: str, response: CachedResponse):
+        self._database.write(self._put, url, response)
+
+    def _put(self, url: str, response: CachedResponse):
+        self._db.execute(
+            "INSERT OR REPLACE INTO http_responses"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, *response, int(time.time())),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_INTERVAL == 0:
+            self._db.execute(
+                "DELETE FROM http_responses WHERE stored <= ?",
+                (int(time.time()) - self.MAX_AGE,),
+            )
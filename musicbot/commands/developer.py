@@ -13,6 +13,7 @@ from discord import app_commands
 from aioconsole import aexec
 
 from config import config
+from musicbot import loader
 from musicbot.bot import Context, MusicBot
 from musicbot.utils import owner_check
 
@@ -78,10 +79,34 @@ class Developer(commands.Cog):
     @commands.check(owner_check)
     async def _ytdlp(self, ctx):
         await ctx.send("Updating yt-dlp...")
-        import subprocess
-        process = subprocess.Popen(["pip", "install", "--upgrade", "yt-dlp[default]"], stdout=subprocess.PIPE)
-        output = process.communicate()[0]
-        await ctx.send(output.decode('utf-8'))
+        # run pip without blocking playback
+        process = await asyncio.create_subprocess_exec(
+            "pip",
+            "install",
+            "--upgrade",
+            "yt-dlp[default]",
+            stdout=asyncio.subprocess.PIPE,
+        )
+        output = (await process.communicate())[0]
+        await ctx.send(output.decode("utf-8"))
+        if process.returncode != 0:
+            return
+        await ctx.send("Starting loader workers with the new yt-dlp...")
+        try:
+            await loader.swap_workers()
+        except asyncio.TimeoutError:
+            await ctx.send("New loader workers didn't start, keeping old ones")
+            return
+        await ctx.send("Loader workers swapped")
+
+    @commands.command(
+        name="loader",
+        hidden=True,
+    )
+    @commands.check(owner_check)
+    async def _loader(self, ctx):
+        lines = [f"{name}: {value}" for name, value in loader.stats().items()]
+        await ctx.send("```\n" + "\n".join(lines) + "```")
 
     @commands.command(
         name="execute",
@@ -11,14 +11,14 @@ from sqlalchemy.exc import IntegrityError
 
 from config import config
 from musicbot import linkutils, utils, loader
-from musicbot.song import Song
+from musicbot.song import Song, SongInfo
 from musicbot.bot import MusicBot, Context
 from musicbot.utils import dj_check, chunks, SimplePaginator
 from musicbot.audiocontroller import PLAYLIST, AudioController, MusicButton
 from musicbot.loader import SongError, search_youtube
-from musicbot.playlist import PlaylistError, LoopMode
+from musicbot.playlist import PlaylistCursor, PlaylistError, LoopMode
 from musicbot.settings import SavedPlaylist
-from musicbot.linkutils import get_site_type, url_regex
+from musicbot.linkutils import url_regex
 
 
 class AudioContext(Context):
@@ -163,19 +163,17 @@ class Music(commands.Cog):
     )
     async def _search(self, ctx, *, query: str):
         await ctx.defer()
-        results = await search_youtube(query, config.SEARCH_RESULTS)
-        songs = []
-        for data in results:
-            song = Song(
-                linkutils.SiteTypes.YT_DLP,
-                webpage_url=data["url"],
-            )
-            song.update(data)
-            songs.append(song)
+        results = await search_youtube(
+            query, config.SEARCH_RESULTS, guild=ctx.guild.id
+        )
+        songs = [
+            Song.from_info(linkutils.SiteTypes.YT_DLP, info)
+            for info in results
+        ]
 
         view = View()
-        for i, data in enumerate(results, start=1):
-            view.add_item(SongButton(self, i, data["url"]))
+        for i, info in enumerate(results, start=1):
+            view.add_item(SongButton(self, i, info.webpage_url))
 
         await ctx.send(
             embed=utils.songs_embed(config.SEARCH_EMBED_TITLE, songs),
@@ -424,8 +422,8 @@ class Music(commands.Cog):
 
         await ctx.defer()
         songs = [
-            {"url": song.webpage_url, "title": song.title}
-            for song in ctx.audiocontroller.playlist.playque
+            {"url": url, "title": title}
+            for url, title in ctx.audiocontroller.playlist.entries()
         ]
         if not songs:
             await ctx.send(config.QUEUE_EMPTY)
@@ -469,15 +467,15 @@ class Music(commands.Cog):
         if playlist is None:
             await ctx.send(config.PLAYLIST_NOT_FOUND)
             return
-        for song_data in json.loads(playlist.songs_json):
-            ctx.audiocontroller.playlist.add(
-                Song(
-                    get_site_type(song_data["url"]),
-                    song_data["url"],
-                    title=song_data["title"],
-                    playlist=playlist,
-                )
+        ctx.audiocontroller.playlist.add(
+            PlaylistCursor(
+                (
+                    SongInfo(song_data["url"], title=song_data["title"])
+                    for song_data in json.loads(playlist.songs_json)
+                ),
+                playlist=playlist,
             )
+        )
         if not ctx.audiocontroller.is_active():
             await ctx.audiocontroller.play_song(
                 ctx.audiocontroller.playlist[0]
@@ -593,7 +591,7 @@ class Music(commands.Cog):
         track: str,
     ):
         await ctx.defer()
-        song = await loader.load_song(track)
+        song = await loader.load_song(track, guild=ctx.guild.id)
         if song is None:
             await ctx.send(config.SONGINFO_ERROR)
             return
@@ -0,0 +1,355 @@
+"""Finds extractors by the host of the URL instead of trying all of them
+
+Hosts are read from the `_VALID_URL` of every extractor: the pattern
+is walked as sequences of literal characters and wildcards until the
+host ends, and the literal end of the host becomes a key. Patterns
+without a known host are keyed by their literal beginning instead,
+and extractors that can't be keyed at all are tried for every URL"""
+
+import re
+import os
+import sys
+import json
+from pathlib import Path
+from re import _constants as sre
+from re import _parser as sre_parse
+from traceback import print_exc
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Union,
+)
+
+from yt_dlp.version import __version__ as yt_dlp_version
+
+
+INDEX_FILE = Path("backup") / "extractor-index.json"
+# give up on patterns with more alternatives than this
+MAX_SEQUENCES = 512
+# characters that end the host part of URLs
+HOST_END = frozenset("/?#")
+
+# a sequence of tokens stands for the strings a pattern may match:
+# str - a literal character
+# frozenset - a wildcard, with characters of HOST_END it may match
+# tuple - where the host ends, with the possible characters or () for the end
+Token = Union[str, FrozenSet[str], tuple]
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _in_matches(items: list, char: str) -> bool:
+    """Whether a character class of the parsed pattern matches `char`,
+    which is one of HOST_END"""
+    negate = False
+    matched = False
+    for op, av in items:
+        if op is sre.NEGATE:
+            negate = True
+        elif op is sre.LITERAL:
+            matched |= chr(av) == char
+        elif op is sre.RANGE:
+            matched |= av[0] <= ord(char) <= av[1]
+        elif op is sre.CATEGORY:
+            # digits, words and spaces don't include HOST_END,
+            # the opposite categories do
+            matched |= av in (
+                sre.CATEGORY_NOT_DIGIT,
+                sre.CATEGORY_NOT_WORD,
+                sre.CATEGORY_NOT_SPACE,
+            )
+        else:
+            raise _Unsupported(op)
+    return matched != negate
+
+
+def _wildcard(op, av) -> FrozenSet[str]:
+    """Returns characters of HOST_END that the item may match"""
+    if op is sre.LITERAL:
+        return frozenset({chr(av)}) & HOST_END
+    if op is sre.NOT_LITERAL:
+        return HOST_END - {chr(av)}
+    if op is sre.IN:
+        return frozenset(c for c in HOST_END if _in_matches(av, c))
+    if op in (sre.MAX_REPEAT, sre.MIN_REPEAT, sre.POSSESSIVE_REPEAT):
+        return _wildcards(av[2])
+    if op in (sre.SUBPATTERN, sre.ATOMIC_GROUP):
+        return _wildcards(av[-1])
+    if op is sre.BRANCH:
+        return frozenset().union(*map(_wildcards, av[1]))
+    if op in (sre.AT, sre.ASSERT, sre.ASSERT_NOT):
+        return frozenset()
+    # ANY, back references and anything else
+    return HOST_END
+
+
+def _wildcards(items) -> FrozenSet[str]:
+    return frozenset().union(*(_wildcard(op, av) for op, av in items))
+
+
+def _case_variants(av) -> Optional[str]:
+    """Returns the letter if the character class is like [yY]"""
+    if all(op is sre.LITERAL for op, _ in av):
+        letters = {chr(c).lower() for _, c in av}
+        if len(letters) == 1:
+            return letters.pop()
+    return None
+
+
+def _host_ended(prefix: tuple) -> bool:
+    if not prefix or not (
+        isinstance(prefix[-1], tuple) or prefix[-1] in HOST_END
+    ):
+        return False
+    return any(
+        prefix[i] == prefix[i + 1] == "/" for i in range(len(prefix) - 2)
+    )
+
+
+def _sequences(items: list, rest: tuple = (), prefix: tuple = ()):
+    """Yields sequences of tokens that the parsed pattern may match,
+    each of them only until the host ends"""
+    if _host_ended(prefix):
+        yield prefix
+        return
+    if not items:
+        if rest:
+            yield from _sequences(rest[0], rest[1:], prefix)
+        else:
+            yield prefix
+        return
+
+    (op, av), items = items[0], items[1:]
+    if op is sre.LITERAL:
+        yield from _sequences(items, rest, prefix + (chr(av),))
+    elif op is sre.IN and _case_variants(av):
+        yield from _sequences(items, rest, prefix + (_case_variants(av),))
+    elif op is sre.IN and all(
+        item_op is sre.LITERAL and chr(item_av) in HOST_END
+        for item_op, item_av in av
+    ):
+        end = tuple(chr(item_av) for _, item_av in av)
+        yield from _sequences(items, rest, prefix + (end,))
+    elif op in (sre.SUBPATTERN, sre.ATOMIC_GROUP):
+        yield from _sequences(list(av[-1]), (items,) + rest, prefix)
+    elif op is sre.BRANCH:
+        for branch in av[1]:
+            yield from _sequences(list(branch), (items,) + rest, prefix)
+    elif op in (sre.MAX_REPEAT, sre.MIN_REPEAT, sre.POSSESSIVE_REPEAT):
+        low, high, sub = av
+        if high == 1:
+            if low == 0:
+                yield from _sequences(items, rest, prefix)
+            yield from _sequences(list(sub), (items,) + rest, prefix)
+        else:
+            token = _wildcards(sub)
+            yield from _sequences(items, rest, prefix + (token,))
+    elif op is sre.AT:
+        if av in (sre.AT_END, sre.AT_END_STRING):
+            yield prefix + ((),)
+        else:
+            yield from _sequences(items, rest, prefix)
+    elif op in (sre.ASSERT, sre.ASSERT_NOT):
+        # only restricts what is matched
+        yield from _sequences(items, rest, prefix)
+    else:
+        token = _wildcard(op, av)
+        yield from _sequences(items, rest, prefix + (token,))
+
+
+def _host_key(sequence: Sequence[Token]) -> str:
+    """Returns a domain that hosts of URLs matched by the sequence end with,
+    hosts being split from URLs as in url_keys"""
+    # the host starts after the first "//", nothing before may contain "/"
+    for start in range(len(sequence) - 1):
+        if sequence[start] == "/" and sequence[start + 1] == "/":
+            break
+        if isinstance(sequence[start], tuple) or "/" in sequence[start]:
+            raise _Unsupported("no host")
+    else:
+        raise _Unsupported("no host")
+
+    host = []
+    for token in sequence[start + 2 :]:
+        if isinstance(token, tuple):
+            end = set(token)
+            break
+        if isinstance(token, str) and token in HOST_END:
+            end = {token}
+            break
+        host.append(token)
+    else:
+        # the pattern may match the beginning of a longer host
+        raise _Unsupported("host may not end")
+
+    wildcards = frozenset().union(
+        *(token for token in host if isinstance(token, frozenset))
+    )
+    # a host may be split at "/" or at any of HOST_END
+    if "/" in wildcards or (wildcards and not end <= {"/"}):
+        raise _Unsupported("host may not end")
+
+    tail = ""
+    for token in reversed(host):
+        if not isinstance(token, str):
+            break
+        tail = token + tail
+    else:
+        # all of the host is known
+        return tail.lower()
+    if not tail.startswith("."):
+        # the first label of the tail may be longer
+        tail = "." + tail.partition(".")[2]
+    if tail == ".":
+        raise _Unsupported("unknown domain")
+    return tail[1:].lower()
+
+
+def _prefix_key(sequence: Sequence[Token]) -> str:
+    """Returns "^" with the literal beginning of URLs matched by the sequence,
+    e.g. for patterns like "ytsearch:..." """
+    prefix = ""
+    for token in sequence:
+        if not isinstance(token, str):
+            break
+        prefix += token
+    if not prefix:
+        raise _Unsupported("unknown beginning")
+    return "^" + prefix.lower()
+
+
+def _key(sequence: Sequence[Token]) -> str:
+    try:
+        return _host_key(sequence)
+    except _Unsupported:
+        return _prefix_key(sequence)
+
+
+def keys(valid_url: Union[str, Sequence[str], bool]) -> Set[str]:
+    """Returns keys from url_keys of all URLs matched by `_VALID_URL`
+
+    Raises _Unsupported if they can't be determined"""
+    if not valid_url or isinstance(valid_url, bool):
+        # never matches by itself
+        raise _Unsupported("no pattern")
+    patterns = [valid_url] if isinstance(valid_url, str) else valid_url
+    result = set()
+    for pattern in patterns:
+        parsed = list(sre_parse.parse(pattern))
+        for n, sequence in enumerate(_sequences(parsed)):
+            if n == MAX_SEQUENCES:
+                raise _Unsupported("too many alternatives")
+            result.add(_key(sequence))
+    return result
+
+
+def url_keys(url: str, prefix_lengths: Iterable[int] = ()) -> Set[str]:
+    """Returns the host of the URL with each of its parent domains,
+    and "^" with its beginnings of `prefix_lengths` characters
+
+    The host is taken both until the first "/" and until any of HOST_END,
+    so that it's found whichever way the pattern of an extractor ends it"""
+    result = {"^" + url[:n].lower() for n in prefix_lengths if n <= len(url)}
+    _, slashes, rest = url.partition("//")
+    if slashes:
+        for host in (rest.partition("/")[0], re.split(r"[/?#]", rest, 1)[0]):
+            labels = host.lower().split(".")
+            result.update(".".join(labels[i:]) for i in range(len(labels)))
+    return result
+
+
+class ExtractorIndex:
+    """Positions of extractors by keys of URLs they may be suitable for"""
+
+    def __init__(self, extractors: list):
+        self.extractors = extractors
+        self.keys: Dict[str, List[int]] = {}
+        # extractors tried for every URL
+        self.fallback: List[int] = []
+        self._prefix_lengths: Set[int] = set()
+
+    def build(self):
+        self.keys = {}
+        self.fallback = []
+        for i, ie in enumerate(self.extractors):
+            try:
+                ie_keys = keys(getattr(ie, "_VALID_URL", None))
+            except (_Unsupported, re.error):
+                self.fallback.append(i)
+                continue
+            for key in ie_keys:
+                self.keys.setdefault(key, []).append(i)
+        self._update()
+
+    def _update(self):
+        self._prefix_lengths = {
+            len(key) - 1 for key in self.keys if key.startswith("^")
+        }
+
+    def _names(self) -> List[str]:
+        return [ie.ie_key() for ie in self.extractors]
+
+    def load(self, path: Path) -> bool:
+        """Loads the index saved for the same extractors"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (
+            data.get("yt-dlp") != yt_dlp_version
+            or data.get("extractors") != self._names()
+        ):
+            return False
+        self.keys = data["keys"]
+        self.fallback = data["fallback"]
+        self._update()
+        return True
+
+    def save(self, path: Path):
+        data = {
+            "yt-dlp": yt_dlp_version,
+            "extractors": self._names(),
+            "keys": self.keys,
+            "fallback": self.fallback,
+        }
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # several processes may save it at the same time
+            temp = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(temp, "w") as f:
+                json.dump(data, f)
+            os.replace(temp, path)
+        except OSError:
+            print_exc(file=sys.stderr)
+
+    def candidates(self, url: str) -> List[int]:
+        """Positions of extractors that may be suitable for the URL"""
+        positions = set(self.fallback)
+        for key in url_keys(url, self._prefix_lengths):
+            positions.update(self.keys.get(key, ()))
+        return sorted(positions)
+
+    def find(self, url: str, exclude: str = "generic") -> Optional[object]:
+        """Returns the first suitable extractor, like trying all of them"""
+        for i in self.candidates(url):
+            ie = self.extractors[i]
+            if ie.IE_NAME != exclude and ie.suitable(url):
+                return ie
+        return None
+
+
+def load_index(extractors: list, path: Path = INDEX_FILE) -> ExtractorIndex:
+    """Loads the saved index, building it again if extractors changed"""
+    index = ExtractorIndex(extractors)
+    if not index.load(path):
+        index.build()
+        index.save(path)
+    return index
@@ -1,49 +1,39 @@
 import re
 import sys
+import codecs
 import asyncio
 from enum import Enum, auto
 from traceback import print_exc
+from time import monotonic
+from html.parser import HTMLParser
 from urllib.parse import urlparse
-from multiprocessing import current_process
-from typing import Optional, Union, List
-
-from spotipy import Spotify
-from bs4 import BeautifulSoup
-from aiohttp import ClientSession
-from spotipy.oauth2 import SpotifyClientCredentials
+from typing import Dict, NamedTuple, Optional, Union, List
+
+from aiohttp import (
+    BasicAuth,
+    ClientResponse,
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+)
 from yt_dlp.extractor import gen_extractor_classes
 from yt_dlp.extractor.common import InfoExtractor
 from yt_dlp.extractor.lazy_extractors import LazyLoadExtractor
 
 from config import config
-from musicbot import loader
-
+from musicbot.cache import (
+    CachedResponse,
+    HTTPCache,
+    TTLCache,
+    response_expire,
+)
+from musicbot.extractor_index import load_index
 
-spotify_api = None
-if config.SPOTIFY_ID or config.SPOTIFY_SECRET:
-    try:
-        spotify_api = Spotify(
-            auth_manager=SpotifyClientCredentials(
-                client_id=config.SPOTIFY_ID,
-                client_secret=config.SPOTIFY_SECRET,
-            )
-        )
-    except Exception:
-        if (
-            # avoid printing this twice
-            current_process().name
-            == "MainProcess"
-        ):
-            print_exc(file=sys.stderr)
-            print(
-                "Failed to connect to Spotify API"
-                " because of the above exception.",
-                file=sys.stderr,
-            )
 
 ExtractorT = Union[InfoExtractor, LazyLoadExtractor]
 EXTRACTORS = gen_extractor_classes()
 YT_IE = next(ie for ie in EXTRACTORS if ie.IE_NAME == "youtube")
+_extractor_index = load_index(EXTRACTORS)
 # Modified version of
 # https://gist.github.com/gruber/249502#gistcomment-1328838
 url_regex = re.compile(
@@ -59,13 +49,31 @@ spotify_regex = re.compile(
 )
 
 headers = {}
+# open connections to all sites and to each of them
+HTTP_CONNECTIONS = 64
+HTTP_HOST_CONNECTIONS = 16
+# seconds to remember resolved host names
+HTTP_DNS_TTL = 300
+# seconds to keep idle connections open
+HTTP_KEEPALIVE = 60
+HTTP_TIMEOUT = ClientTimeout(total=60, sock_connect=10, sock_read=30)
 
 _session = None
+_http_cache = HTTPCache()
 
 
 async def init():
     global _session
-    _session = ClientSession(headers=headers)
+    _session = ClientSession(
+        headers=headers,
+        connector=TCPConnector(
+            limit=HTTP_CONNECTIONS,
+            limit_per_host=HTTP_HOST_CONNECTIONS,
+            ttl_dns_cache=HTTP_DNS_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE,
+        ),
+        timeout=HTTP_TIMEOUT,
+    )
 
 
 async def stop():
@@ -87,31 +95,286 @@ class SpotifyPlaylistTypes(Enum):
     ALBUM = "album"
 
 
-async def get_soup(url: str) -> BeautifulSoup:
-    async with _session.get(url) as response:
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+# largest pages the API returns
+SPOTIFY_PAGE_SIZES = {
+    SpotifyPlaylistTypes.PLAYLIST: 100,
+    SpotifyPlaylistTypes.ALBUM: 50,
+}
+# how many pages of a playlist are fetched at the same time
+SPOTIFY_PAGE_FETCHES = 8
+# renew the token this many seconds before it expires
+SPOTIFY_TOKEN_MARGIN = 60
+# responses worth sending the request again for
+SPOTIFY_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+SPOTIFY_RETRIES = 3
+# seconds to wait without Retry-After, doubled for each retry
+SPOTIFY_RETRY_DELAY = 1
+# give up if asked to wait longer than this many seconds
+SPOTIFY_MAX_RETRY_AFTER = 30
+
+
+class SpotifyAPI:
+    """Spotify Web API client using the shared session
+
+    Authenticates with client credentials, the token is kept
+    until shortly before it expires"""
+
+    def __init__(self, client_id: str, client_secret: str):
+        self._auth = BasicAuth(client_id, client_secret)
+        self._token = None
+        self._token_expire = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def _get_token(self) -> str:
+        async with self._token_lock:
+            if self._token is None or monotonic() >= self._token_expire:
+                async with _session.post(
+                    SPOTIFY_TOKEN_URL,
+                    data={"grant_type": "client_credentials"},
+                    auth=self._auth,
+                ) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+                self._token = data["access_token"]
+                self._token_expire = (
+                    monotonic() + data["expires_in"] - SPOTIFY_TOKEN_MARGIN
+                )
+            return self._token
+
+    async def get(self, path: str, **params) -> dict:
+        """Rate limits and server errors are retried a few times,
+        waiting as long as Retry-After asks"""
+        renewed = False
+        retries = 0
+        while True:
+            token = await self._get_token()
+            async with _session.get(
+                f"{SPOTIFY_API_URL}/{path}",
+                params=params,
+                headers={"Authorization": f"Bearer {token}"},
+            ) as response:
+                if response.status == 401 and not renewed:
+                    # revoked early, get a new one
+                    renewed = True
+                    if self._token == token:
+                        self._token = None
+                    continue
+                delay = _retry_delay(response, retries)
+                if delay is None:
+                    response.raise_for_status()
+                    return await response.json()
+            retries += 1
+            await asyncio.sleep(delay)
+
+    async def track(self, code: str) -> dict:
+        return await self.get(f"tracks/{code}")
+
+    async def tracks(
+        self, list_type: SpotifyPlaylistTypes, code: str
+    ) -> List[dict]:
+        """Returns all items of the album or playlist
+
+        Pages after the first one are fetched concurrently"""
+        path = f"{list_type.value}s/{code}/tracks"
+        limit = SPOTIFY_PAGE_SIZES[list_type]
+        first = await self.get(path, limit=limit)
+        fetches = asyncio.Semaphore(SPOTIFY_PAGE_FETCHES)
+
+        async def get_page(offset: int) -> List[dict]:
+            async with fetches:
+                page = await self.get(path, limit=limit, offset=offset)
+            return page["items"]
+
+        pages = await asyncio.gather(
+            *(
+                get_page(offset)
+                for offset in range(limit, first["total"], limit)
+            )
+        )
+        items = first["items"]
+        for page in pages:
+            items.extend(page)
+        return items
+
+
+def _retry_delay(response: ClientResponse, retries: int) -> Optional[float]:
+    """Returns seconds to wait before sending the request again,
+    None if it shouldn't be sent again"""
+    if (
+        response.status not in SPOTIFY_RETRY_STATUSES
+        or retries >= SPOTIFY_RETRIES
+    ):
+        return None
+    try:
+        delay = float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        delay = SPOTIFY_RETRY_DELAY * 2**retries
+    if delay > SPOTIFY_MAX_RETRY_AFTER:
+        return None
+    return delay
+
+
+spotify_api = None
+if config.SPOTIFY_ID or config.SPOTIFY_SECRET:
+    spotify_api = SpotifyAPI(config.SPOTIFY_ID, config.SPOTIFY_SECRET)
+
+
+# how much of a page is read at once when looking for its metadata
+META_CHUNK_SIZE = 16 * 1024
+
+
+class PageMeta(HTMLParser):
+    """Collects the title and meta tags of a page until its <head> ends
+
+    Meta tags are stored by their property or name,
+    so `meta["og:image"]` is a list of contents of such tags"""
+
+    def __init__(self):
+        super().__init__()
+        self.title: Optional[str] = None
+        self.meta: Dict[str, List[str]] = {}
+        self.done = False
+        self._in_title = False
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns content of the first meta tag with the property or name"""
+        values = self.meta.get(key)
+        return values[0] if values else None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "meta":
+            attrs = dict(attrs)
+            key = attrs.get("property") or attrs.get("name")
+            if key and attrs.get("content") is not None:
+                self.meta.setdefault(key, []).append(attrs["content"])
+        elif tag == "title" and self.title is None:
+            self.title = ""
+            self._in_title = True
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+
+async def get_meta(url: str) -> PageMeta:
+    """Reads the page only until the end of its <head>
+
+    What was read is cached for as long as the response headers allow,
+    then revalidated with ETag or Last-Modified"""
+    cached = await _http_cache.get(url)
+    if cached is not None and cached.fresh:
+        return _parse_meta(cached.body, cached.charset)
+
+    request_headers = {}
+    if cached is not None and cached.etag:
+        request_headers["If-None-Match"] = cached.etag
+    if cached is not None and cached.last_modified:
+        request_headers["If-Modified-Since"] = cached.last_modified
+
+    parser = PageMeta()
+    body = []
+    async with _session.get(url, headers=request_headers) as response:
+        if response.status == 304 and cached is not None:
+            expire = response_expire(response.headers)
+            if expire is not None:
+                _http_cache.put(url, cached._replace(expire=expire))
+            return _parse_meta(cached.body, cached.charset)
         response.raise_for_status()
-        page = await response.text()
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(
+            errors="replace"
+        )
+        async for chunk in response.content.iter_chunked(META_CHUNK_SIZE):
+            body.append(chunk)
+            parser.feed(decoder.decode(chunk))
+            if parser.done:
+                # the rest of the connection is dropped
+                break
+        else:
+            parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+
+    expire = response_expire(response.headers)
+    if expire is not None:
+        page = CachedResponse(
+            b"".join(body),
+            response.charset,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            expire,
+        )
+        # stale pages are only worth keeping if they can be revalidated
+        if page.fresh or page.etag or page.last_modified:
+            _http_cache.put(url, page)
+    return parser
+
+
+def _parse_meta(body: bytes, charset: Optional[str]) -> PageMeta:
+    parser = PageMeta()
+    parser.feed(body.decode(charset or "utf-8", errors="replace"))
+    parser.close()
+    return parser
 
-    return BeautifulSoup(page, "html.parser")
 
+class SpotifySong(NamedTuple):
+    # YouTube search query
+    query: str
+    # only known when using the API
+    isrc: Optional[str] = None
 
-async def fetch_spotify(url: str) -> Optional[Union[dict, List[str]]]:
-    """Searches YouTube for Spotify song or loads Spotify playlist"""
+
+# songs seen in playlists, so loading them needs no more requests
+SPOTIFY_SONG_CACHE_SIZE = 10000
+SPOTIFY_SONG_CACHE_TTL = 24 * 60 * 60
+_spotify_songs = TTLCache(SPOTIFY_SONG_CACHE_SIZE, SPOTIFY_SONG_CACHE_TTL)
+
+
+def _spotify_song(track_data: dict) -> SpotifySong:
+    artists = track_data.get("artists")
+    artist = artists[0]["name"] if artists else ""
+    return SpotifySong(
+        _spotify_query(track_data["name"], artist),
+        track_data.get("external_ids", {}).get("isrc"),
+    )
+
+
+def _spotify_query(title: str, artist: str) -> str:
+    if artist:
+        return f"{title} - {artist} \"Topic\""
+    return f"{title} \"Topic\""
+
+
+async def fetch_spotify(url: str) -> Union[SpotifySong, List[dict]]:
+    """Returns info of Spotify song or entries of Spotify playlist"""
     match = spotify_regex.match(url)
     # strip any extra parts
     url = match.group()
     url_type = match.group("type")
+    code = match.group("code")
     if url_type != "track":
-        return await fetch_spotify_playlist(url, url_type, match.group("code"))
+        return await fetch_spotify_playlist(url, url_type, code)
+
+    song = _spotify_songs.get(code)
+    if song is not None:
+        return song
 
     if spotify_api:
-        track_data = spotify_api.track(url)
-        title = track_data["name"]
-        artist = track_data["artists"][0]["name"]
+        return _spotify_song(await spotify_api.track(code))
     else:
-        soup = await get_soup(url)
+        page = await get_meta(url)
 
-        title_str = soup.find("title").string
+        title_str = page.title
         # Match "Title - song and lyrics by Artist | Spotify"
         match = re.match(
             r"(.*) - song(?: and lyrics)? by (.*) \| Spotify", title_str
@@ -121,46 +384,30 @@ async def fetch_spotify(url: str) -> Optional[Union[dict, List[str]]]:
         else:
             # Fallback if regex doesn't match
             title, artist = title_str, ""
-
-    if artist:
-        query = f"{title} - {artist} \"Topic\""
-    else:
-        query = f"{title} \"Topic\""
-
-    # use sync function because we're already in executor
-    results = loader._search_youtube(query)
-    return results[0] if results else None
+        return SpotifySong(_spotify_query(title, artist))
 
 
 async def fetch_spotify_playlist(
     url: str, list_type: str, code: str
-) -> List[str]:
-    """Returns list of Spotify links"""
+) -> List[dict]:
+    """Returns entries with Spotify links and, if known, song info"""
 
     if spotify_api:
-        return fetch_playlist_with_api(SpotifyPlaylistTypes(list_type), code)
-
-    soup = await get_soup(url)
-    results = soup.find_all(attrs={"name": "music:song", "content": True})
+        return await fetch_playlist_with_api(
+            SpotifyPlaylistTypes(list_type), code
+        )
 
-    return [item["content"] for item in results]
+    page = await get_meta(url)
+    return [{"url": song} for song in page.meta.get("music:song", [])]
 
 
-def fetch_playlist_with_api(
+async def fetch_playlist_with_api(
     list_type: SpotifyPlaylistTypes, code: str
-) -> List[str]:
+) -> List[dict]:
     tracks = []
     try:
-        if list_type == SpotifyPlaylistTypes.ALBUM:
-            results = spotify_api.album_tracks(code)
-        elif list_type == SpotifyPlaylistTypes.PLAYLIST:
-            results = spotify_api.playlist_items(code)
-
-        if results:
-            while results:
-                tracks.extend(results["items"])
-                results = spotify_api.next(results)
-        else:
+        tracks = await spotify_api.tracks(list_type, code)
+        if not tracks:
             print(
                 f"Warning: Spotify API returned nothing"
                 f" for {list_type} {code}",
@@ -173,17 +420,39 @@ def fetch_playlist_with_api(
         )
         print_exc(file=sys.stderr)
 
-    links = []
+    entries = []
     for track in tracks:
+        # playlist items wrap tracks, album tracks are as is
+        track_data = track.get("track", track)
+        if not track_data:
+            # removed from Spotify
+            continue
         try:
-            links.append(track.get("track", track)["external_urls"]["spotify"])
+            entries.append(_spotify_entry(track_data))
         except KeyError as e:
             print(
                 f"Warning: Cannot extract URL from {track}:"
                 f" field {e.args[0]!r} is missing",
                 file=sys.stderr,
             )
-    return links
+            continue
+        _spotify_songs.put(track_data["id"], _spotify_song(track_data))
+    return entries
+
+
+def _spotify_entry(track_data: dict) -> dict:
+    """Returns song info of the track in the form yt-dlp uses"""
+    artists = track_data.get("artists")
+    images = track_data.get("album", {}).get("images")
+    duration = track_data.get("duration_ms")
+    return {
+        "url": track_data["external_urls"]["spotify"],
+        "title": track_data.get("name"),
+        "uploader": artists[0]["name"] if artists else None,
+        "duration": duration // 1000 if duration else None,
+        # first image is the largest
+        "thumbnail": images[0]["url"] if images else None,
+    }
 
 
 def get_urls(content: str) -> List[str]:
@@ -191,10 +460,37 @@ def get_urls(content: str) -> List[str]:
 
 
 def get_ie(url: str) -> Optional[ExtractorT]:
-    for ie in EXTRACTORS:
-        if ie.suitable(url) and ie.IE_NAME != "generic":
-            return ie
-    return None
+    return _extractor_index.find(url, exclude="generic")
+
+
+def site_name(ie: ExtractorT) -> str:
+    """Returns name of the extractor module (effectively means site)"""
+    # extractor *may* be lazy
+    module = getattr(ie, "_module", None) or ie.__module__
+    return module.rpartition(".")[2]
+
+
+def get_site(url: str) -> str:
+    """Returns name of the site that `load_song` will extract `url` from"""
+    host = identify_url(url)
+    if host == SiteTypes.NOT_URL:
+        return site_name(YT_IE)
+    if isinstance(host, SiteTypes):
+        return host.name.lower()
+    return site_name(host)
+
+
+def canonicalize(url: str) -> str:
+    """Returns a key that is the same for all URLs of the same media"""
+    if match := spotify_regex.match(url):
+        return f"spotify:{match.group('type')}:{match.group('code')}"
+
+    if ie := get_ie(url):
+        media_id = ie.get_temp_id(url)
+        if media_id:
+            return f"{ie.ie_key()}:{media_id}"
+
+    return url.partition("#")[0]
 
 
 def identify_url(url: str) -> Union[SiteTypes, ExtractorT]:
@@ -1,30 +1,57 @@
+import os
 import sys
 import json
-import atexit
+import queue
+import pickle
 import asyncio
 import threading
-from inspect import getmodule
+from copy import deepcopy
+from enum import IntEnum
+from collections import deque
+from time import monotonic
+from itertools import count
+from functools import partial
+from inspect import isgenerator
+from traceback import print_exc
+from glob import glob
+from pathlib import Path
 from urllib.parse import urlparse
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from multiprocessing import get_context as mp_context
-from typing import List, Optional, Union
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from aiohttp import ClientResponseError
 from yt_dlp import YoutubeDL
-from yt_dlp.utils import DownloadError
+from yt_dlp.utils import DownloadError, GeoRestrictedError
 
 from config import config
 from musicbot.bot import MusicBot
-from musicbot.song import Song
+from musicbot.song import Song, SongInfo
+from musicbot.cache import ExtractionCache, SpotifyMapping, TTLCache
 from musicbot.utils import OutputWrapper
 from musicbot.linkutils import (
     YT_IE,
     ExtractorT,
     SiteTypes,
     get_ie,
+    get_site,
+    site_name,
+    canonicalize,
     fetch_spotify,
     identify_url,
+    spotify_regex,
     init as init_session,
     stop as stop_session,
 )
@@ -34,6 +61,44 @@ sys.stdout = OutputWrapper(sys.stdout)
 sys.stderr = OutputWrapper(sys.stderr)
 
 _context = mp_context("spawn")
+# threads running jobs inside each worker
+# most of them are waiting for network or for a free downloader
+WORKER_THREADS = 16
+# how many times a job is sent again if its worker dies
+JOB_RETRIES = 1
+# seconds to wait for a stopped worker to exit
+WORKER_EXIT_TIMEOUT = 10
+# seconds to wait before starting a worker that died while warming up
+RESPAWN_DELAY = 5
+# seconds to wait for new workers to warm up in swap_workers
+SWAP_TIMEOUT = 300
+# seconds a cancelled job may keep running before its worker is replaced
+STUCK_JOB_TIMEOUT = 300
+# seconds yt-dlp waits for a server to answer
+SOCKET_TIMEOUT = 30
+# where yt-dlp keeps player code and signature data between restarts
+YTDL_CACHE_DIR = Path("backup") / "yt-dlp"
+# how many recent job durations of each site to keep for hedging
+LATENCY_SAMPLES = 100
+# don't hedge until a site has this many samples
+MIN_LATENCY_SAMPLES = 20
+# how many recent results of each site decide if it's healthy
+HEALTH_WINDOW = 20
+MIN_HEALTH_SAMPLES = 5
+# share of bad results that makes background jobs of a site wait
+BREAKER_ERROR_RATE = 0.5
+# jobs taking longer than this many seconds count as bad
+SLOW_JOB = 30
+# seconds to hold background jobs, doubled each time probes fail
+BREAKER_BACKOFF = 30
+BREAKER_MAX_BACKOFF = 600
+# seconds of requests counted for spreading them between identities
+IDENTITY_WINDOW = 60
+# seconds to rest after a rate limit, doubled for each one in a row
+IDENTITY_REST = 60
+IDENTITY_MAX_STRIKES = 5
+# keys of plugin extractors with an async `resolve` classmethod
+NATIVE_EXTRACTORS = frozenset({"SunoAI", "DiscordAttachments"})
 
 
 class LoaderProcess(_context.Process):
@@ -45,100 +110,1428 @@ class LoaderProcess(_context.Process):
             pass
 
 
-_context.Process = LoaderProcess
-
-
-async def close_bot_session():
-    # close session opened in musicbot/yt_dlp_plugins/extractor/discord.py
-    from musicbot.__main__ import bot
-
-    await bot.http.close()
-
-
-_loop = asyncio.new_event_loop()
-_loop.run_until_complete(init_session())
-atexit.register(lambda: _loop.run_until_complete(stop_session()))
-atexit.register(lambda: _loop.run_until_complete(close_bot_session()))
-_executor = ProcessPoolExecutor(1, _context)
-_downloader = YoutubeDL(
-    {
-        "format": "bestaudio/best",
-        "extract_flat": True,
-        "noplaylist": True,
-        # default_search shouldn't be needed as long as
-        # we don't pass plain text to the downloader.
-        # still leaving it just in case
-        "default_search": "auto",
-        "cookiefile": config.COOKIE_PATH,
-        "quiet": True,
-        "extractor_args": {
-            "youtube": {
-               "player-client": ["default", "tv"]
-            },
-            "youtubepot-bgutilhttp": {
-                "base_url": ["http://bgutil-provider:4416"]
-            }
+class WorkerError(Exception):
+    pass
+
+
+class Priority(IntEnum):
+    """Order in which queued jobs are sent to workers, lower goes first"""
+
+    # the song that is about to play
+    PLAYBACK = 0
+    # commands used by people
+    INTERACTIVE = 1
+    # preloading of the queue
+    BACKGROUND = 2
+
+
+class _Job:
+    def __init__(
+        self,
+        f: Callable,
+        args: tuple,
+        site: str,
+        guild: Optional[int],
+        priority: Priority,
+        flights: Iterable["_Flight"] = (),
+    ):
+        self.id = next(_job_ids)
+        self.f = f
+        self.args = args
+        self.site = site
+        self.guild = guild
+        self.queued_at = monotonic()
+        self._priority = priority
+        # shared loads this job is doing
+        self.flights = tuple(flights)
+        self.future = asyncio.get_running_loop().create_future()
+        # set when a worker gets the job
+        self.started = asyncio.get_running_loop().create_future()
+        self.started_at: Optional[float] = None
+        self.worker: Optional["_Worker"] = None
+        # worker that shouldn't get this job if others can
+        self.avoid: Optional["_Worker"] = None
+        # values yielded by the job, if it's a generator
+        self.stream: Optional[asyncio.Queue] = None
+        # whether the stream got anything, the job can't be retried then
+        self.streamed = False
+        # whether the worker sent the result, even if nobody took it
+        self.answered = False
+        # whether any song of a batch was rate limited
+        self.rate_limited = False
+        self.attempts = 0
+        # site slots taken, batches run several songs at once
+        self.slots = 1
+        # guild counter of the scheduler the job counts towards
+        self.counter: Optional[Dict[int, int]] = None
+
+    @property
+    def priority(self) -> Priority:
+        # shared loads get the highest priority of their callers
+        if self.flights:
+            return min(flight.priority for flight in self.flights)
+        return self._priority
+
+    @property
+    def playlist(self) -> bool:
+        """Whether the job streams a playlist,
+        batches stream too but load songs of their flights"""
+        return self.stream is not None and not self.flights
+
+
+class _Worker:
+    """A single extraction process
+
+    Jobs are sent over a pipe and run in a thread pool inside the process,
+    so the worker can wait for several sites at once.
+    The process is started again if it dies, and replaced after
+    LOADER_MAX_JOBS jobs or when it grows over LOADER_MAX_MEMORY.
+    New processes get jobs only after warming up"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._main_loop: Optional[asyncio.AbstractEventLoop] = None
+        # jobs sent to this worker and not finished yet
+        self.jobs: Dict[int, _Job] = {}
+        # cancelled jobs still running in the process
+        # and when they were cancelled, they keep their site slot
+        self.abandoned: Dict[int, Tuple[_Job, float]] = {}
+        self.running: Dict[str, int] = {}
+        # jobs sent to the current process
+        self.jobs_run = 0
+        # waiting for running jobs to finish before being replaced
+        self.retiring = False
+        self.ready = False
+        # resolved when the current process is warmed up
+        self.warmed_up: Optional[asyncio.Future] = None
+        # replaced by swap_workers, won't be started again
+        self.replaced = False
+        self.restarts = 0
+        self._start_after = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self.jobs) + len(self.abandoned)
+
+    def can_run(self, job: _Job) -> bool:
+        limit = config.SITE_CONCURRENCY.get(job.site, 1)
+        if limit > 1 and (job.playlist or job.priority == Priority.BACKGROUND):
+            # one slot is kept for songs about to play and commands
+            limit -= 1
+        return (
+            not self.retiring
+            and self.ready
+            and self.pending < WORKER_THREADS
+            and self.running.get(job.site, 0) + job.slots <= limit
+        )
+
+    def start(self):
+        if (
+            self.process is not None
+            or self.replaced
+            or monotonic() < self._start_after
+        ):
+            return
+        try:
+            self._main_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            self.warmed_up = self._main_loop.create_future()
+        self.jobs_run = 0
+        self.ready = False
+        self._conn, child_conn = _context.Pipe()
+        self.process = LoaderProcess(
+            target=_worker_main, args=(child_conn,), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        threading.Thread(
+            target=self._read_results,
+            args=(self.process, self._conn),
+            daemon=True,
+        ).start()
+
+    def run(self, job: _Job):
+        self._main_loop = job.future.get_loop()
+        self.jobs[job.id] = job
+        self.running[job.site] = self.running.get(job.site, 0) + job.slots
+        self.jobs_run += 1
+        job.attempts += 1
+        job.worker = self
+        job.started_at = monotonic()
+        if not job.started.done():
+            job.started.set_result(None)
+        job.future.add_done_callback(partial(self._finish, job))
+        try:
+            with self._send_lock:
+                self._conn.send((job.id, job.f, job.args))
+        except (OSError, ValueError):
+            # the process died, _died will retry the job
+            pass
+        except Exception as e:
+            job.future.set_exception(e)
+
+    def _finish(self, job: _Job, _=None):
+        if self.jobs.pop(job.id, None) is None:
+            # the job was already sent to another worker
+            return
+        if (
+            job.future.cancelled()
+            and self.process is not None
+            and not job.answered
+        ):
+            self._cancel(job)
+        else:
+            self.running[job.site] -= job.slots
+        if job.future.done() and not job.future.cancelled():
+            _record_result(
+                job, job.future.exception(), monotonic() - job.started_at
+            )
+        self._retire_if_done()
+        _scheduler.finished(job)
+
+    def _retire_if_done(self):
+        if self.process is not None:
+            if not self.retiring and self._worn_out():
+                self.retiring = True
+            if self.retiring and not self.jobs:
+                self._stop()
+
+    def _cancel(self, job: _Job):
+        """Tells the process that nobody waits for the job anymore
+
+        The job keeps its site slot until the process answers,
+        so new jobs don't wait behind it for the same downloader"""
+        self.abandoned[job.id] = (job, monotonic())
+        self._main_loop.call_later(
+            STUCK_JOB_TIMEOUT, self._check_stuck, job.id, self.process
+        )
+        with self._send_lock:
+            try:
+                self._conn.send((job.id, None, None))
+            except (AttributeError, OSError, ValueError):
+                # the process is gone anyway
+                pass
+
+    def _answered(
+        self, process: LoaderProcess, job_id: int, success, result
+    ):
+        """Passes what the process sent to the job,
+        or frees the slot if the job was cancelled meanwhile"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            if success is not None:
+                self._release(job_id, process, None if success else result)
+        elif success is None:
+            job.streamed = True
+            job.stream.put_nowait(result)
+        else:
+            job.answered = True
+            _set_future(job.future, success, result)
+
+    def _release(
+        self,
+        job_id: int,
+        process: LoaderProcess,
+        error: Optional[BaseException],
+    ):
+        """Frees the slot of a cancelled job that the process finished"""
+        if self.process is not process:
+            return
+        try:
+            job, _ = self.abandoned.pop(job_id)
+        except KeyError:
+            return
+        self.running[job.site] -= job.slots
+        # jobs that ran past their deadline tell the most about the site
+        _record_result(job, error, monotonic() - job.started_at)
+        self._retire_if_done()
+        _scheduler.dispatch()
+
+    def _check_stuck(self, job_id: int, process: LoaderProcess):
+        if self.process is not process or job_id not in self.abandoned:
+            return
+        job, _ = self.abandoned[job_id]
+        _site_health(job.site).record(True)
+        print(
+            f"Loader worker {self.index} has a stuck job, replacing it",
+            file=sys.stderr,
+        )
+        self.retiring = True
+        self._retire_if_done()
+
+    def _forget_abandoned(self):
+        for job, _ in self.abandoned.values():
+            self.running[job.site] -= job.slots
+        self.abandoned.clear()
+
+    def _worn_out(self) -> bool:
+        if config.LOADER_MAX_JOBS and self.jobs_run >= config.LOADER_MAX_JOBS:
+            return True
+        if config.LOADER_MAX_MEMORY:
+            rss = _rss(self.process.pid)
+            return rss is not None and rss > config.LOADER_MAX_MEMORY * 2**20
+        return False
+
+    def retire(self):
+        """Stops taking jobs and exits when the running ones finish"""
+        self.replaced = True
+        self.retiring = True
+        if self.process is not None and not self.jobs:
+            self._stop()
+
+    def _stop(self):
+        """Lets the process exit and starts a new one if still needed"""
+        with self._send_lock:
+            try:
+                self._conn.send(None)
+            except (OSError, ValueError):
+                pass
+        if self.abandoned:
+            # the process waits for cancelled jobs before exiting,
+            # don't let a stuck one keep it around forever
+            oldest = min(since for _, since in self.abandoned.values())
+            self._main_loop.call_later(
+                max(0.0, oldest + STUCK_JOB_TIMEOUT - monotonic()),
+                _kill,
+                self.process,
+            )
+            self._forget_abandoned()
+        self.process = self._conn = None
+        self.retiring = False
+        self.restarts += 1
+        self.start()
+
+    def _ready(self):
+        self.ready = True
+        if self.warmed_up is not None and not self.warmed_up.done():
+            self.warmed_up.set_result(None)
+        _scheduler.dispatch()
+
+    def _died(self, process: LoaderProcess):
+        if self.process is not process:
+            # stopped on purpose
+            return
+        print(
+            f"Loader worker {self.index} died"
+            f" with exit code {process.exitcode}, restarting",
+            file=sys.stderr,
+        )
+        if not self.ready:
+            # don't restart a broken setup in a tight loop
+            self._start_after = monotonic() + RESPAWN_DELAY
+            if self._main_loop is not None:
+                self._main_loop.call_later(RESPAWN_DELAY, _scheduler.dispatch)
+        self.process = self._conn = None
+        self._forget_abandoned()
+        self.retiring = False
+        self.restarts += 1
+        self.start()
+        error = WorkerError(f"Loader worker {self.index} died")
+        for job in list(self.jobs.values()):
+            self._finish(job)
+            if job.future.done():
+                continue
+            if job.attempts <= JOB_RETRIES and not job.streamed:
+                _scheduler.submit(job)
+            else:
+                job.future.set_exception(error)
+
+    def _read_results(self, process: LoaderProcess, conn):
+        while True:
+            try:
+                job_id, success, result = conn.recv()
+            except (EOFError, OSError):
+                break
+            if job_id is None:
+                # warm-up is done
+                if self._main_loop is None:
+                    self.ready = True
+                else:
+                    self._main_loop.call_soon_threadsafe(self._ready)
+                continue
+            # the job may be cancelled until the main loop gets this
+            self._main_loop.call_soon_threadsafe(
+                self._answered, process, job_id, success, result
+            )
+        conn.close()
+        process.join(WORKER_EXIT_TIMEOUT)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        # nobody will answer remaining jobs of this process
+        if self._main_loop is None:
+            self._died(process)
+            return
+        try:
+            self._main_loop.call_soon_threadsafe(self._died, process)
+        except RuntimeError:
+            # the bot is shutting down
+            pass
+
+
+class _GuildStats:
+    def __init__(self):
+        self.jobs = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def add(self, wait: float):
+        self.jobs += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+
+class _SiteHealth:
+    """Circuit breaker of a site
+
+    Trips when too many recent jobs were rate limited or slow.
+    While open, background jobs wait and only one other job runs
+    at a time as a probe. After the backoff one job of any priority
+    is let through, and the first probe result closes or reopens it"""
+
+    def __init__(self, site: str):
+        self.site = site
+        self.window: deque[bool] = deque(maxlen=HEALTH_WINDOW)
+        self.open_until = 0.0
+        self.backoff = BREAKER_BACKOFF
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if not self.open_until:
+            return "closed"
+        if monotonic() < self.open_until:
+            return "open"
+        return "half-open"
+
+    def allows(self, job: _Job, running: int) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" and job.priority == Priority.BACKGROUND:
+            return False
+        return running == 0
+
+    def record(self, bad: bool):
+        state = self.state
+        if state == "open":
+            # jobs started before it tripped, don't extend the backoff
+            if not bad:
+                self._close()
+            return
+        if state == "half-open":
+            if bad:
+                self._trip()
+            else:
+                self._close()
+            return
+        self.window.append(bad)
+        if (
+            len(self.window) >= MIN_HEALTH_SAMPLES
+            and sum(self.window) / len(self.window) >= BREAKER_ERROR_RATE
+        ):
+            self._trip()
+
+    def _trip(self):
+        print(
+            f"Holding background jobs of {self.site}"
+            f" for {self.backoff} seconds",
+            file=sys.stderr,
+        )
+        self.open_until = monotonic() + self.backoff
+        asyncio.get_running_loop().call_later(
+            self.backoff, _scheduler.dispatch
+        )
+        self.backoff = min(self.backoff * 2, BREAKER_MAX_BACKOFF)
+        self.trips += 1
+        self.window.clear()
+
+    def _close(self):
+        self.open_until = 0.0
+        self.backoff = BREAKER_BACKOFF
+        self.window.clear()
+
+
+def _site_health(site: str) -> _SiteHealth:
+    try:
+        return _health[site]
+    except KeyError:
+        health = _health[site] = _SiteHealth(site)
+        return health
+
+
+def _record_result(job: _Job, error: Optional[BaseException], took: float):
+    if job.playlist or job.stream is None:
+        # batches are counted after their songs
+        _record_health(job, error, took)
+    if job.stream is None and error is None:
+        _latencies.setdefault(
+            job.site, deque(maxlen=LATENCY_SAMPLES)
+        ).append(took)
+
+
+def _record_health(job: _Job, error: Optional[BaseException], took: float):
+    """Counts the job as one result of its site
+
+    Playlists take as long as they are, so only their errors count.
+    A batch is bad if any of its songs was rate limited,
+    or slow if its songs took longer than SLOW_JOB on average"""
+    if job.playlist:
+        took = 0.0
+    elif job.flights:
+        took /= len(job.flights)
+    bad = job.rate_limited or isinstance(error, RateLimitError)
+    _site_health(job.site).record(bad or took > SLOW_JOB)
+
+
+class _Scheduler:
+    """Holds jobs until a worker can start them right away
+
+    This way jobs never wait in a worker's queue
+    and more important ones can overtake the rest.
+    Jobs of the same priority are taken from guilds in turn,
+    and a guild can't have more than MAX_GUILD_JOBS preloads
+    and MAX_GUILD_STREAMS playlists loading at once.
+    Songs about to play and commands aren't limited,
+    and preloads and playlists leave them a slot of each site"""
+
+    def __init__(self):
+        self.queue: List[_Job] = []
+        # slots taken by preloads and playlists of each guild
+        self.running: Dict[int, int] = {}
+        self.streams: Dict[int, int] = {}
+        self.stats: Dict[int, _GuildStats] = {}
+        # when each guild got its last job started
+        self._served: Dict[int, int] = {}
+        self._turns = count()
+
+    def submit(self, job: _Job):
+        self.queue.append(job)
+        self.dispatch()
+
+    def cancel(self, job: _Job):
+        try:
+            self.queue.remove(job)
+        except ValueError:
+            pass
+
+    def finished(self, job: _Job):
+        if job.counter is not None:
+            job.counter[job.guild] -= job.slots
+            job.counter = None
+        self.dispatch()
+
+    def _guild_limit(self, job: _Job) -> Optional[Tuple[Dict[int, int], int]]:
+        """Returns the counter of the guild's jobs like this one
+        and their limit, None if they aren't limited"""
+        if job.guild is None:
+            return None
+        if job.playlist:
+            return self.streams, config.MAX_GUILD_STREAMS
+        if job.priority == Priority.BACKGROUND:
+            return self.running, config.MAX_GUILD_JOBS
+        return None
+
+    def dispatch(self):
+        for worker in _workers:
+            worker.start()
+        while self.queue:
+            best = None
+            for job in self.queue:
+                limit = self._guild_limit(job)
+                if (
+                    limit is not None
+                    and limit[0].get(job.guild, 0) + job.slots > limit[1]
+                ):
+                    continue
+                turn = self._served.get(job.guild, -1)
+                order = (job.priority, turn, job.id)
+                if best is not None and order >= best[0]:
+                    continue
+                if not _site_health(job.site).allows(
+                    job, sum(w.running.get(job.site, 0) for w in _workers)
+                ):
+                    continue
+                workers = [w for w in _workers if w.can_run(job)]
+                if workers:
+                    worker = min(
+                        workers, key=lambda w: (w is job.avoid, w.pending)
+                    )
+                    best = (order, job, worker)
+            if best is None:
+                return
+            _, job, worker = best
+            self.queue.remove(job)
+            self._start(job, worker)
+
+    def _start(self, job: _Job, worker: "_Worker"):
+        if job.guild is not None:
+            self._served[job.guild] = next(self._turns)
+        limit = self._guild_limit(job)
+        if limit is not None:
+            job.counter = limit[0]
+            job.counter[job.guild] = job.counter.get(job.guild, 0) + job.slots
+        try:
+            stats = self.stats[job.guild]
+        except KeyError:
+            stats = self.stats[job.guild] = _GuildStats()
+        stats.add(monotonic() - job.queued_at)
+        worker.run(job)
+
+
+def _set_future(future: asyncio.Future, success: bool, result):
+    if future.done():
+        return
+    if success:
+        future.set_result(result)
+    else:
+        future.set_exception(result)
+
+
+def _worker_main(conn):
+    executor = ThreadPoolExecutor(WORKER_THREADS)
+    send_lock = threading.Lock()
+    running = set()
+    cancelled = set()
+
+    def send(message: tuple):
+        with send_lock:
+            conn.send(message)
+
+    _warm_up()
+    send((None, True, None))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            # asked to exit, finish the running jobs first
+            break
+        job_id, f, args = message
+        if f is None:
+            if job_id in running:
+                cancelled.add(job_id)
+            continue
+        running.add(job_id)
+        executor.submit(
+            _run_job, send, job_id, f, args, running, cancelled
+        )
+    executor.shutdown()
+
+
+def _run_job(
+    send: Callable[[tuple], None],
+    job_id: int,
+    f,
+    args: tuple,
+    running: set,
+    cancelled: set,
+):
+    """Runs the job inside a worker and sends the result back
+
+    Values yielded by generators are sent as soon as they're ready,
+    cancelled generators are stopped before the next value"""
+    try:
+        result = f(*args)
+        if isgenerator(result):
+            for item in result:
+                if job_id in cancelled:
+                    result.close()
+                    break
+                send((job_id, None, item))
+            result = None
+        send((job_id, True, result))
+    except Exception as e:
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            print_exc(file=sys.stderr)
+            e = WorkerError(repr(e))
+        send((job_id, False, e))
+    finally:
+        running.discard(job_id)
+        cancelled.discard(job_id)
+
+
+def _warm_up():
+    """Prepares yt-dlp so the first real extraction is as fast as later ones
+
+    Player code and signature data come from YTDL_CACHE_DIR if possible,
+    WARMUP_URL fetches them if they aren't there yet"""
+    try:
+        with _site_downloader(YT_IE) as downloader:
+            # loads the real extractor class behind the lazy one
+            downloader.get_info_extractor(YT_IE.ie_key())
+        if config.WARMUP_URL:
+            extract_info(config.WARMUP_URL)
+    except Exception:
+        print("Loader warm-up failed:", file=sys.stderr)
+        print_exc(file=sys.stderr)
+
+
+def _kill(process: LoaderProcess):
+    if process.is_alive():
+        process.kill()
+
+
+def _rss(pid: int) -> Optional[int]:
+    """Returns resident memory of the process in bytes, None if unknown"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _pool_size() -> int:
+    if config.LOADER_PROCESSES > 0:
+        return config.LOADER_PROCESSES
+    # extraction is mostly network-bound, but every process
+    # carries its own copy of yt-dlp, so don't go overboard
+    return max(1, min(os.cpu_count() or 1, 4))
+
+
+_job_ids = count()
+# durations of recent successful jobs by site
+_latencies: Dict[str, deque] = {}
+_health: Dict[str, _SiteHealth] = {}
+_hedges = 0
+_workers = [_Worker(i) for i in range(_pool_size())]
+_scheduler = _Scheduler()
+_DOWNLOADER_OPTIONS = {
+    "format": "bestaudio/best",
+    "extract_flat": True,
+    "noplaylist": True,
+    # default_search shouldn't be needed as long as
+    # we don't pass plain text to the downloader.
+    # still leaving it just in case
+    "default_search": "auto",
+    "cookiefile": config.COOKIE_PATH,
+    "cachedir": str(YTDL_CACHE_DIR),
+    "quiet": True,
+    "socket_timeout": SOCKET_TIMEOUT,
+    "extractor_args": {
+        "youtube": {
+           "player-client": ["default", "tv"]
         },
-        "ignoreerrors": "only_download"
-        # "verbose": True
-        # "remote_components": "ejs:npm"
-    }
-)
+        "youtubepot-bgutilhttp": {
+            "base_url": ["http://bgutil-provider:4416"]
+        }
+    },
+    "ignoreerrors": "only_download"
+    # "verbose": True
+    # "remote_components": "ejs:npm"
+}
+
+
+class _Identity:
+    """An account used for extraction, identified by its cookies file"""
+
+    def __init__(self, cookiefile: str):
+        self.cookiefile = cookiefile
+        # when recent requests were made
+        self.requests: deque[float] = deque()
+        # rate limits in a row
+        self.strikes = 0
+        self.resting_until = 0.0
+
+    def load(self) -> tuple:
+        """Less loaded identities are used first"""
+        now = monotonic()
+        while self.requests and self.requests[0] < now - IDENTITY_WINDOW:
+            self.requests.popleft()
+        return self.resting_until > now, len(self.requests)
+
+    def rate_limited(self):
+        rest = IDENTITY_REST * 2 ** min(self.strikes, IDENTITY_MAX_STRIKES)
+        self.strikes += 1
+        self.resting_until = monotonic() + rest
+        print(
+            f"{self.cookiefile} is rate limited, resting for {rest} seconds",
+            file=sys.stderr,
+        )
+
+
+def _cookie_files() -> List[str]:
+    if config.COOKIE_DIR and os.path.isdir(config.COOKIE_DIR):
+        files = sorted(glob(os.path.join(config.COOKIE_DIR, "*.txt")))
+        if files:
+            return files
+    return [config.COOKIE_PATH]
+
+
+class _SitePool:
+    """Downloaders for one site
+
+    At most `size` extractions of the site run at the same time,
+    each one using its own downloader with identical options
+    except cookies. Every request goes to the identity that made
+    the fewest requests lately and isn't resting after a rate limit"""
+
+    def __init__(self, size: int):
+        self._slots = threading.BoundedSemaphore(size)
+        # free downloaders of each identity
+        self._free: Dict[str, queue.SimpleQueue] = {}
+
+    @contextmanager
+    def downloader(self):
+        with self._slots:
+            with _identities_lock:
+                identity = min(_identities, key=_Identity.load)
+                identity.requests.append(monotonic())
+            free = self._free.setdefault(
+                identity.cookiefile, queue.SimpleQueue()
+            )
+            try:
+                downloader = free.get_nowait()
+            except queue.Empty:
+                downloader = YoutubeDL(
+                    {**_DOWNLOADER_OPTIONS, "cookiefile": identity.cookiefile}
+                )
+            try:
+                yield downloader
+            except RateLimitError:
+                with _identities_lock:
+                    identity.rate_limited()
+                raise
+            else:
+                identity.strikes = 0
+            finally:
+                free.put(downloader)
+
+
+_identities = [_Identity(cookiefile) for cookiefile in _cookie_files()]
+_identities_lock = threading.Lock()
+
+
+# the running bot, set by init
+_bot: Optional[MusicBot] = None
 _preloading = {}
-_site_locks = {}
+# jobs running for all guilds, see _single_flight
+_flights = {}
+_extraction_cache = ExtractionCache()
+_spotify_mapping = SpotifyMapping()
+# don't use cached stream URLs that expire sooner than this
+# (in addition to song duration)
+EXPIRE_MARGIN = 300
+GUILD_STATS_SHOWN = 10
+# how many songs of a playlist are sent at once when streaming
+STREAM_BATCH_SIZE = 100
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 6 * 60 * 60
+# each process has its own copy
+_search_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+_site_pools = {}
+_site_pools_lock = threading.Lock()
 
 
 class SongError(Exception):
     pass
 
 
-def _noop():
+class TemporarySongError(SongError):
+    """Loading may work if tried again later"""
+
+
+class RateLimitError(TemporarySongError):
     pass
 
 
-def init():
-    # wake it up to spawn the process immediately
-    _executor.submit(_noop).result()
+class UnavailableSongError(SongError):
+    """The song was removed or is private"""
+
+
+class RegionLockedError(UnavailableSongError):
+    pass
+
+
+# parts of yt-dlp errors that mean the site is throttling us
+_RATE_LIMIT_MESSAGES = (
+    "HTTP Error 429",
+    "Too Many Requests",
+    "confirm you're not a bot",
+    "rate-limited",
+)
+
+
+def _check_rate_limit(e: DownloadError):
+    if any(message in str(e) for message in _RATE_LIMIT_MESSAGES):
+        raise RateLimitError(config.SONGINFO_RATE_LIMITED) from e
+
+
+# parts of yt-dlp errors that mean the song can't be played by anyone
+_UNAVAILABLE_MESSAGES = (
+    "Video unavailable",
+    "Private video",
+    "This video is private",
+    "This video has been removed",
+    "account associated with this video has been terminated",
+    "available to this channel's members",
+    "HTTP Error 404",
+    "HTTP Error 410",
+)
+
+
+def _check_status(e: ClientResponseError):
+    if e.status == 429:
+        raise RateLimitError(config.SONGINFO_RATE_LIMITED) from e
+    if e.status in (404, 410):
+        raise UnavailableSongError(config.SONGINFO_UNAVAILABLE) from e
+
+
+def _check_unavailable(e: DownloadError):
+    if e.exc_info and isinstance(e.exc_info[1], GeoRestrictedError):
+        raise RegionLockedError(config.SONGINFO_REGION_LOCKED) from e
+    if any(message in str(e) for message in _UNAVAILABLE_MESSAGES):
+        raise UnavailableSongError(config.SONGINFO_UNAVAILABLE) from e
+
+
+# how many seconds URLs that failed to load are rejected
+# without asking a worker, by error class.
+# The closest listed base class counts, errors not listed aren't remembered
+FAILURE_TTLS = {
+    RegionLockedError: 24 * 60 * 60,
+    UnavailableSongError: 6 * 60 * 60,
+    # timeouts and rate limits aren't the fault of the URL
+    TemporarySongError: 0,
+    SongError: 5 * 60,
+}
+FAILURE_CACHE_SIZE = 4096
+# URLs that failed recently, shared by all guilds
+_failures = TTLCache(FAILURE_CACHE_SIZE, 0)
+
+
+def _remember_failure(key: str, error: Exception):
+    for cls in type(error).__mro__:
+        if cls in FAILURE_TTLS:
+            if FAILURE_TTLS[cls]:
+                _failures.put(key, error, FAILURE_TTLS[cls])
+            return
+
+
+def _recent_failure(key: str) -> Optional[SongError]:
+    """Returns the error the URL failed with recently, if any"""
+    return _failures.get(key)
+
+
+async def init(bot: MusicBot):
+    """Opens the HTTP session and starts the workers,
+    so they warm up before the first request"""
+    global _bot
+    _bot = bot
+    await init_session()
+    YTDL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for worker in _workers:
+        worker.start()
+
+
+async def close():
+    await stop_session()
+
+
+async def swap_workers():
+    """Replaces the workers with new processes, e.g. after updating yt-dlp
+
+    The new workers take jobs once they are warmed up,
+    the old ones finish the jobs they are running and exit"""
+    standby = [_Worker(worker.index) for worker in _workers]
+    for worker in standby:
+        worker.start()
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(worker.warmed_up for worker in standby)),
+            SWAP_TIMEOUT,
+        )
+    except BaseException:
+        for worker in standby:
+            worker.retire()
+        raise
+    old = _workers[:]
+    _workers[:] = standby
+    for worker in old:
+        worker.retire()
+    _scheduler.dispatch()
+
+
+def stats() -> Dict[str, object]:
+    """Returns loader counters for displaying to the owner"""
+    result = {}
+    for worker in _workers:
+        result[f"worker {worker.index} pending"] = worker.pending
+        result[f"worker {worker.index} ready"] = worker.ready
+        result[f"worker {worker.index} jobs run"] = worker.jobs_run
+        result[f"worker {worker.index} restarts"] = worker.restarts
+    result["queued jobs"] = len(_scheduler.queue)
+    for site in _latencies:
+        p95 = _p95(site)
+        if p95 is not None:
+            result[f"{site} p95"] = f"{p95:.2f}s"
+    result["hedged jobs"] = _hedges
+    for site, health in _health.items():
+        if health.trips:
+            bad = sum(health.window)
+            result[f"{site} breaker"] = (
+                f"{health.state}, tripped {health.trips} times,"
+                f" {bad}/{len(health.window)} recent jobs bad"
+            )
+    # show the guilds that waited the most
+    waited = sorted(_scheduler.stats.items(), key=lambda i: -i[1].total_wait)
+    for guild, guild_stats in waited[:GUILD_STATS_SHOWN]:
+        result[f"guild {guild} wait"] = (
+            f"avg {guild_stats.total_wait / guild_stats.jobs:.2f}s,"
+            f" max {guild_stats.max_wait:.2f}s, {guild_stats.jobs} jobs"
+        )
+    result["extraction cache hits"] = _extraction_cache.hits
+    result["extraction cache misses"] = _extraction_cache.misses
+    result["known bad URLs rejected"] = _failures.hits
+    result["spotify mapping hits"] = _spotify_mapping.hits
+    result["spotify mapping misses"] = _spotify_mapping.misses
+    result["search cache hits"] = _search_cache.hits
+    result["search cache misses"] = _search_cache.misses
+    return result
+
+
+def _site_downloader(ie: ExtractorT):
+    site = site_name(ie)
+    with _site_pools_lock:
+        try:
+            pool = _site_pools[site]
+        except KeyError:
+            pool = _site_pools[site] = _SitePool(
+                config.SITE_CONCURRENCY.get(site, 1)
+            )
+    return pool.downloader()
 
 
 def extract_info(url: str, ie: Optional[ExtractorT] = None) -> Optional[dict]:
     if ie is None:
         ie = get_ie(url)
-    # cache by module (effectively means by site)
-    # extractor *may* be lazy
-    module = getmodule(getattr(ie, "real_class", ie))
-    try:
-        lock = _site_locks[module]
-    except KeyError:
-        lock = _site_locks[module] = threading.Lock()
-    with lock:
+    with _site_downloader(ie) as downloader:
         try:
-            return _downloader.extract_info(url, False, ie.ie_key())
-        except DownloadError:
+            return downloader.extract_info(url, False, ie.ie_key())
+        except DownloadError as e:
+            _check_rate_limit(e)
+            _check_unavailable(e)
             return None
 
 
-async def search_youtube(title: str, count: int = 1) -> Optional[dict]:
-    return await _run_sync(_search_youtube, title, count)
+class _Flight:
+    def __init__(self, priority: Priority):
+        self.task = None
+        self.callers = 0
+        # callers that didn't give up yet
+        self.waiting = 0
+        self.priority = priority
+
+    def promote(self, priority: Priority):
+        if priority < self.priority:
+            self.priority = priority
+            _scheduler.dispatch()
+
+
+async def _single_flight(
+    key: tuple,
+    priority: Priority,
+    factory: Callable[["_Flight"], Awaitable],
+):
+    """Makes concurrent calls with the same key share one job
+
+    The job gets the highest priority of its callers.
+    Every caller receives its own copy of the result"""
+    flight = _flights.get(key)
+    if flight is None:
+        flight = _flights[key] = _Flight(priority)
+        flight.task = asyncio.ensure_future(factory(flight))
+        flight.task.add_done_callback(lambda _: _flights.pop(key, None))
+    else:
+        flight.promote(priority)
+    flight.callers += 1
+    flight.waiting += 1
+    try:
+        # one caller giving up shouldn't cancel the job for others
+        result = await asyncio.shield(flight.task)
+    except asyncio.CancelledError:
+        # but the last one should, batch items are left to their batch
+        if flight.waiting == 1 and isinstance(flight.task, asyncio.Task):
+            flight.task.cancel()
+        raise
+    finally:
+        flight.waiting -= 1
+    if flight.callers > 1:
+        result = deepcopy(result)
+    return result
 
 
-def _search_youtube(title: str, count: int = 1) -> Optional[dict]:
+def _search_key(title: str, count: int) -> tuple:
+    return " ".join(title.lower().split()), count
+
+
+async def search_youtube(
+    title: str,
+    count: int = 1,
+    priority: Priority = Priority.INTERACTIVE,
+    guild: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Optional[List[SongInfo]]:
     """Searches youtube for the video title
-    Returns the first results video link"""
+    Raises SongError if it takes longer than `timeout` seconds,
+    None means LOAD_TIMEOUT and 0 means no limit"""
+    return await _with_timeout(_search(title, count, priority, guild), timeout)
+
+
+async def _with_timeout(aw: Awaitable, timeout: Optional[float]):
+    if timeout is None:
+        timeout = config.LOAD_TIMEOUT
+    try:
+        return await asyncio.wait_for(aw, timeout or None)
+    except asyncio.TimeoutError as e:
+        raise TemporarySongError(config.SONGINFO_TIMEOUT) from e
+
+
+async def _search(
+    title: str,
+    count: int,
+    priority: Priority,
+    guild: Optional[int],
+) -> Optional[List[SongInfo]]:
+    key = _search_key(title, count)
+    entries = _search_cache.get(key)
+    if entries is None:
+        entries = await _single_flight(
+            ("search", *key),
+            priority,
+            partial(_search_and_cache, title, count, key, guild),
+        )
+    return entries
+
+
+async def _search_and_cache(
+    title: str,
+    count: int,
+    key: tuple,
+    guild: Optional[int],
+    flight: _Flight,
+) -> Optional[List[SongInfo]]:
+    entries = await _run_sync(
+        _search_youtube,
+        title,
+        count,
+        site=site_name(YT_IE),
+        guild=guild,
+        flight=flight,
+    )
+    if entries:
+        _search_cache.put(key, entries)
+    return entries
+
+
+def _search_youtube(
+    title: str, count: int = 1
+) -> Optional[List[SongInfo]]:
+    """Searches youtube for the video title
+    Returns info of the first `count` results"""
 
     r = extract_info(f"ytsearch{count}:{title}")
 
     if not r:
         return None
 
-    return r["entries"]
+    return [SongInfo.from_entry(entry) for entry in r["entries"]]
+
+
+async def load_song(
+    track: str,
+    priority: Priority = Priority.INTERACTIVE,
+    guild: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Union[Optional[Song], List[Song]]:
+    """Raises SongError if loading takes longer than `timeout` seconds,
+    None means LOAD_TIMEOUT and 0 means no limit"""
+    return await _with_timeout(_load(track, priority, guild), timeout)
+
+
+async def _load(
+    track: str, priority: Priority, guild: Optional[int]
+) -> Union[Optional[Song], List[Song]]:
+    if identify_url(track) == SiteTypes.NOT_URL:
+        # search here to use the cache of the main process
+        entries = await _search(track, 1, priority, guild)
+        if not entries:
+            return None
+        track = entries[0].webpage_url
+
+    info = await _load_info(track, priority, guild)
+    return _to_songs(_song_host(track), info)
+
+
+async def _load_info(
+    track: str, priority: Priority, guild: Optional[int]
+) -> Union[None, SongInfo, List[SongInfo]]:
+    """Loads the URL through the caches, sharing the load with other callers"""
+    key = canonicalize(track)
+    info = await _get_cached_info(key)
+    if info is None:
+        error = _recent_failure(key)
+        if error is not None:
+            raise error
+        info = await _single_flight(
+            ("load", key),
+            priority,
+            partial(_load_and_cache, track, key, guild),
+        )
+    return info
+
+
+def _song_host(track: str) -> SiteTypes:
+    """Host of the songs loaded from `track`"""
+    host = identify_url(track)
+    if isinstance(host, SiteTypes) and host != SiteTypes.NOT_URL:
+        return host
+    return SiteTypes.YT_DLP
+
+
+def _to_songs(
+    host: SiteTypes, info: Union[None, SongInfo, List[SongInfo]]
+) -> Union[Optional[Song], List[Song]]:
+    if info is None:
+        return None
+    if isinstance(info, SongInfo):
+        return Song.from_info(host, info)
+    return [Song.from_info(host, entry) for entry in info]
+
+
+async def _load_and_cache(
+    track: str, key: str, guild: Optional[int], flight: _Flight
+) -> Union[None, SongInfo, List[SongInfo]]:
+    try:
+        if _resolves_natively(identify_url(track)):
+            result = await _resolve(track, guild, flight)
+        else:
+            result = await _run_sync(
+                _load_song,
+                track,
+                site=get_site(track),
+                guild=guild,
+                flight=flight,
+            )
+    except SongError as e:
+        _remember_failure(key, e)
+        raise
+    if isinstance(result, SongInfo):
+        _cache_info(result, key)
+    return result
+
+
+async def load_songs(
+    tracks: List[str],
+    priority: Priority = Priority.INTERACTIVE,
+    guild: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[Tuple[int, Union[None, Song, List[Song], Exception]]]:
+    """Loads several tracks at once
+
+    Yields index of each track together with what load_song would return,
+    in the order they finish. Errors are yielded instead of being raised,
+    including SongError for tracks not loaded in `timeout` seconds.
+    Tracks that aren't cached or loading already are split between
+    the workers and sent to each of them in one message"""
+    results = asyncio.Queue()
+    batches: Dict[str, List[Tuple[int, str, str]]] = {}
+    batched = set()
+    for i, track in enumerate(tracks):
+        host = identify_url(track)
+        if host != SiteTypes.NOT_URL:
+            key = canonicalize(track)
+            info = await _get_cached_info(key)
+            if info is not None:
+                results.put_nowait((i, _to_songs(_song_host(track), info)))
+                continue
+            error = _recent_failure(key)
+            if error is not None:
+                results.put_nowait((i, error))
+                continue
+            if (
+                key not in batched
+                and ("load", key) not in _flights
+                and not _resolves_natively(host)
+            ):
+                batched.add(key)
+                batches.setdefault(get_site(track), []).append(
+                    (i, track, key)
+                )
+                continue
+        # searches, shared and native loads go one by one
+        asyncio.ensure_future(
+            _load_into(results, i, track, priority, guild, timeout)
+        )
+
+    for site, items in batches.items():
+        for n in range(len(_workers)):
+            part = items[n :: len(_workers)]
+            if part:
+                _submit_batch(results, part, site, priority, guild)
+
+    if timeout is None:
+        timeout = config.LOAD_TIMEOUT
+    deadline = asyncio.get_running_loop().time() + timeout
+    left = set(range(len(tracks)))
+    while left:
+        try:
+            index, result = await asyncio.wait_for(
+                results.get(),
+                (deadline - asyncio.get_running_loop().time())
+                if timeout
+                else None,
+            )
+        except asyncio.TimeoutError:
+            # the loads go on in case someone needs them later
+            for index in left:
+                yield index, TemporarySongError(config.SONGINFO_TIMEOUT)
+            return
+        left.discard(index)
+        yield index, result
+
+
+async def _load_into(
+    results: asyncio.Queue,
+    index: int,
+    track: str,
+    priority: Priority,
+    guild: Optional[int],
+    timeout: Optional[float],
+):
+    try:
+        result = await load_song(track, priority, guild, timeout)
+    except Exception as e:
+        result = e
+    results.put_nowait((index, result))
+
+
+def _submit_batch(
+    results: asyncio.Queue,
+    items: List[Tuple[int, str, str]],
+    site: str,
+    priority: Priority,
+    guild: Optional[int],
+):
+    """Starts one job loading all `items`,
+    other callers can join the load of each item meanwhile"""
+    loop = asyncio.get_running_loop()
+    flights = []
+    for _, _, key in items:
+        flight = _flights[("load", key)] = _Flight(priority)
+        flight.task = loop.create_future()
+        flight.task.add_done_callback(partial(_end_flight, ("load", key)))
+        flights.append(flight)
+    tracks = [track for _, track, _ in items]
+    # the batch takes a site slot for each of its threads, so it must
+    # fit into the limits of its guild and leave the kept site slot
+    threads = max(
+        1,
+        min(
+            config.SITE_CONCURRENCY.get(site, 1) - 1,
+            config.MAX_GUILD_JOBS,
+            len(tracks),
+        ),
+    )
+    job = _Job(
+        _load_song_batch, (tracks, threads), site, guild, priority, flights
+    )
+    job.slots = threads
+    job.stream = asyncio.Queue()
+    job.future.add_done_callback(lambda _: job.stream.put_nowait(job))
+    _scheduler.submit(job)
+    asyncio.ensure_future(_collect_batch(results, items, job))
+
+
+def _end_flight(key: tuple, future: asyncio.Future):
+    _flights.pop(key, None)
+    if not future.cancelled():
+        # nobody may have joined, don't warn about unretrieved errors
+        future.exception()
+
+
+async def _collect_batch(
+    results: asyncio.Queue, items: List[Tuple[int, str, str]], job: _Job
+):
+    """Passes what a batch job yields to its flights and to the caller"""
+    # the job itself marks the end of the stream
+    while (message := await job.stream.get()) is not job:
+        n, success, result = message
+        if isinstance(result, RateLimitError):
+            job.rate_limited = True
+        _finish_item(results, items[n], job.flights[n], success, result)
+    try:
+        job.future.result()
+    except Exception as e:
+        error = e
+        _record_health(job, e, monotonic() - job.started_at)
+    else:
+        error = SongError(config.SONGINFO_ERROR)
+        _record_health(job, None, monotonic() - job.started_at)
+    # items left without a result if the worker failed
+    for item, flight in zip(items, job.flights):
+        if not flight.task.done():
+            _finish_item(results, item, flight, False, error)
+
+
+def _finish_item(
+    results: asyncio.Queue,
+    item: Tuple[int, str, str],
+    flight: _Flight,
+    success: bool,
+    result,
+):
+    index, track, key = item
+    if success:
+        if isinstance(result, SongInfo):
+            _cache_info(result, key)
+        flight.task.set_result(result)
+        result = _to_songs(_song_host(track), result)
+    else:
+        _remember_failure(key, result)
+        flight.task.set_exception(result)
+    results.put_nowait((index, result))
+
+
+async def _get_cached_info(key: str) -> Optional[SongInfo]:
+    data = await _extraction_cache.get(key, EXPIRE_MARGIN)
+    if data is None:
+        return None
+    info = SongInfo(**data)
+    if info.duration and not _expires_after(info, info.duration):
+        return None
+    return info
+
+
+def _cache_info(info: SongInfo, key: Optional[str]):
+    if info.url is None:
+        return
+    expire = _parse_expire(info.url)
+    if expire is None:
+        return
+    data = info._asdict()
+    keys = {canonicalize(info.webpage_url), key}
+    keys.discard(None)
+    for key in keys:
+        _extraction_cache.put(key, data, expire)
 
 
-async def load_song(track: str) -> Union[Optional[Song], List[Song]]:
-    return await _run_sync(_load_song, track)
+def _expires_after(info: SongInfo, seconds: int) -> bool:
+    expire = _parse_expire(info.url)
+    return expire is None or expire > (
+        datetime.now(timezone.utc).timestamp() + EXPIRE_MARGIN + seconds
+    )
 
 
-def _load_song(track: str) -> Union[Optional[Song], List[Song]]:
+def _load_song(track: str) -> Union[None, SongInfo, List[SongInfo]]:
     host = identify_url(track)
 
     if host == SiteTypes.NOT_URL:
@@ -148,32 +1541,142 @@ def _load_song(track: str) -> Union[Optional[Song], List[Song]]:
         data = data[0]
         host = SiteTypes.YT_DLP
 
-    elif host == SiteTypes.UNKNOWN:
+    elif isinstance(host, SiteTypes):
+        # unknown, others are resolved by the main process
         return None
 
-    elif host == SiteTypes.SPOTIFY:
-        try:
-            data = _loop.run_until_complete(fetch_spotify(track))
-        except ClientResponseError as e:
-            raise SongError(config.SONGINFO_ERROR) from e
-        if isinstance(data, list):
-            data = [{"url": url} for url in data]
+    else:  # host is info extractor
+        data = extract_info(track, host)
+
+    return _info_from_data(track, data)
 
-    elif host == SiteTypes.CUSTOM:
+
+def _resolves_natively(host: Union[SiteTypes, ExtractorT]) -> bool:
+    """Whether tracks from `host` are loaded on the main event loop
+
+    They only need a few HTTP requests, so they don't take worker slots
+    and can load concurrently without limit"""
+    if isinstance(host, SiteTypes):
+        return host in (SiteTypes.SPOTIFY, SiteTypes.CUSTOM)
+    # checking for `resolve` would load the real class of lazy extractors
+    return host.ie_key() in NATIVE_EXTRACTORS
+
+
+async def _resolve(
+    track: str, guild: Optional[int], flight: _Flight
+) -> Union[None, SongInfo, List[SongInfo]]:
+    """Loads the track of a host that _resolves_natively"""
+    host = identify_url(track)
+    if host == SiteTypes.CUSTOM:
         data = {
             "url": track,
             "webpage_url": track,
             "title": urlparse(track).path.rpartition("/")[2],
         }
+        return SongInfo.from_data(data, track)
 
-    else:  # host is info extractor
-        data = extract_info(track, host)
-        host = SiteTypes.YT_DLP
+    if host == SiteTypes.SPOTIFY:
+        match = spotify_regex.match(track)
+        if match.group("type") == "track":
+            return await _load_spotify_song(
+                track, match.group("code"), guild, flight
+            )
+
+    try:
+        if host == SiteTypes.SPOTIFY:
+            data = await fetch_spotify(track)
+        else:
+            data = await host.resolve(track, _bot)
+    except ClientResponseError as e:
+        _check_status(e)
+        raise SongError(config.SONGINFO_ERROR) from e
+    except Exception as e:
+        print_exc(file=sys.stderr)
+        raise SongError(config.SONGINFO_ERROR) from e
 
+    return _info_from_data(track, data)
+
+
+async def _load_spotify_song(
+    track: str, code: str, guild: Optional[int], flight: _Flight
+) -> Optional[SongInfo]:
+    """Loads the YouTube video that plays the Spotify song
+
+    The video is searched only if the song isn't mapped
+    to a video that is still available"""
+    mapped = await _spotify_mapping.get(code)
+    info = mapped and await _load_mapped_video(mapped, guild, flight)
+    if info:
+        return info
+
+    try:
+        song = await fetch_spotify(track)
+    except ClientResponseError as e:
+        _check_status(e)
+        raise SongError(config.SONGINFO_ERROR) from e
+    except Exception as e:
+        print_exc(file=sys.stderr)
+        raise SongError(config.SONGINFO_ERROR) from e
+    # other releases of the same recording
+    mapped = song.isrc and await _spotify_mapping.get_by_isrc(song.isrc)
+    info = mapped and await _load_mapped_video(mapped, guild, flight)
+    if not info:
+        entries = await _search(song.query, 1, flight.priority, guild)
+        if not entries:
+            return None
+        mapped = entries[0].webpage_url
+        info = await _load_info(mapped, flight.priority, guild)
+    _spotify_mapping.put(code, song.isrc, mapped)
+    return info
+
+
+async def _load_mapped_video(
+    url: str, guild: Optional[int], flight: _Flight
+) -> Optional[SongInfo]:
+    """Returns None if the video is no longer available"""
+    try:
+        return await _load_info(url, flight.priority, guild)
+    except UnavailableSongError:
+        _spotify_mapping.forget(url)
+        return None
+
+
+def _load_song_batch(tracks: List[str], threads: int):
+    """Loads tracks using `threads` threads
+
+    Yields index, success and result of each track as soon as it's done"""
+    executor = ThreadPoolExecutor(threads)
+    try:
+        futures = {
+            executor.submit(_load_song, track): i
+            for i, track in enumerate(tracks)
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], True, future.result()
+            except SongError as e:
+                yield futures[future], False, e
+            except Exception:
+                print_exc(file=sys.stderr)
+                yield futures[future], False, SongError(config.SONGINFO_ERROR)
+    finally:
+        # don't start the rest if the job was cancelled
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _info_from_data(
+    track: str, data: Union[None, dict, SongInfo, List[dict]]
+) -> Union[SongInfo, List[SongInfo]]:
     if not data:
         raise SongError(config.SONGINFO_ERROR)
 
-    if isinstance(data, dict):
+    if isinstance(data, SongInfo):
+        # a search result, the URL wasn't extracted yet
+        data = extract_info(data.webpage_url, YT_IE)
+        if not data:
+            raise SongError(config.SONGINFO_ERROR)
+
+    elif isinstance(data, dict):
         if "entries" in data:
             # assuming a playlist
             data = data["entries"]
@@ -184,21 +1687,80 @@ def _load_song(track: str) -> Union[Optional[Song], List[Song]]:
                 raise SongError(config.SONGINFO_ERROR)
 
     if isinstance(data, list):
-        results = []
-        for entry in data:
-            entry.pop("webpage_url", None)
-            song = Song(
-                host,
-                webpage_url=entry.pop("url"),
+        return [SongInfo.from_entry(entry) for entry in data]
+
+    return SongInfo.from_data(data, track)
+
+
+def may_be_playlist(track: str) -> bool:
+    host = identify_url(track)
+    if host == SiteTypes.SPOTIFY:
+        return spotify_regex.match(track).group("type") != "track"
+    if isinstance(host, SiteTypes):
+        return False
+    return getattr(host, "_RETURN_TYPE", None) != "video"
+
+
+def _load_song_stream(track: str):
+    """Loads the track, yielding playlists in batches
+
+    The first batch has only one song, so it can start playing right away.
+    If there's only one song, it's yielded as is"""
+    host = identify_url(track)
+    if isinstance(host, SiteTypes):
+        yield from _batches(_as_list(_load_song(track)))
+        return
+
+    with _site_downloader(host) as downloader:
+        try:
+            # don't process to get playlist entries as they are fetched
+            data = downloader.extract_info(
+                track, False, host.ie_key(), process=False
             )
-            song.update(entry)
-            results.append(song)
-        return results
+            if data and data.get("_type") not in ("playlist", "multi_video"):
+                data = downloader.process_ie_result(data, download=False)
+                yield from _batches(_as_list(_info_from_data(track, data)))
+                return
+        except DownloadError as e:
+            _check_rate_limit(e)
+            _check_unavailable(e)
+            data = None
+        if not data:
+            raise SongError(config.SONGINFO_ERROR)
 
-    song = Song(host, webpage_url=track)
-    song.update(data)
+        yield from _batches(
+            SongInfo.from_entry(entry) for entry in data["entries"] if entry
+        )
 
-    return song
+
+def _as_list(result) -> list:
+    """Wraps a single song or its info into a list"""
+    if result is None:
+        return []
+    if isinstance(result, (Song, SongInfo)):
+        return [result]
+    return result
+
+
+def _batches(songs: Iterable):
+    songs = iter(songs)
+    first = next(songs, None)
+    if first is None:
+        return
+    second = next(songs, None)
+    if second is None:
+        # special-case one-item playlists
+        yield first
+        return
+    yield [first]
+    batch = [second]
+    for song in songs:
+        batch.append(song)
+        if len(batch) == STREAM_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def _parse_expire(url: str) -> Optional[int]:
@@ -211,30 +1773,108 @@ def _parse_expire(url: str) -> Optional[int]:
         return None
 
 
-async def preload(song: Song, bot: MusicBot) -> bool:
-    if song.webpage_url is None:
+async def preload(
+    song: Song,
+    bot: MusicBot,
+    priority: Priority = Priority.BACKGROUND,
+    guild: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Optional[bool]:
+    """Loads the stream URL of the song
+    Returns whether it worked, or None if it may work later"""
+    if not _needs_preload(song):
         return True
 
+    future = _preloading.get(song)
+    if future:
+        _promote(song.webpage_url, priority)
+        return await future
+    _preloading[song] = asyncio.Future()
+
+    try:
+        preloaded = await load_song(
+            song.webpage_url, priority, guild, timeout
+        )
+    except (SongError, WorkerError) as e:
+        preloaded = e
+    return await _finish_preload(song, preloaded, bot)
+
+
+async def preload_songs(
+    songs: List[Song],
+    bot: MusicBot,
+    priority: Priority = Priority.BACKGROUND,
+    guild: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[Tuple[Song, Optional[bool]]]:
+    """Preloads several songs with load_songs
+
+    Yields each song with the result of preloading as soon as it's done,
+    see preload"""
+    waiting = []
+    loading: Dict[Song, None] = {}
+    for song in songs:
+        if not _needs_preload(song):
+            yield song, True
+        elif song in _preloading:
+            _promote(song.webpage_url, priority)
+            waiting.append((song, _preloading[song]))
+        elif song not in loading:
+            loading[song] = None
+            _preloading[song] = asyncio.Future()
+
+    loading = list(loading)
+    unfinished = set(loading)
+    try:
+        async for i, preloaded in load_songs(
+            [song.webpage_url for song in loading], priority, guild, timeout
+        ):
+            song = loading[i]
+            if isinstance(preloaded, Exception) and not isinstance(
+                preloaded, (SongError, WorkerError)
+            ):
+                print(
+                    f"Failed to preload {song.webpage_url}: {preloaded!r}",
+                    file=sys.stderr,
+                )
+            success = await _finish_preload(song, preloaded, bot)
+            unfinished.discard(song)
+            yield song, success
+    finally:
+        # let later calls try again if the caller stopped early
+        for song in unfinished:
+            _preloading.pop(song).set_result(None)
+
+    for song, future in waiting:
+        yield song, await future
+
+
+def _needs_preload(song: Song) -> bool:
+    if song.webpage_url is None:
+        return False
+
     if song.url is not None:
         expire = _parse_expire(song.url)
         if expire is None or expire == _parse_expire(song.webpage_url):
-            return True
+            return False
         if datetime.now(timezone.utc) < datetime.fromtimestamp(
             expire, timezone.utc
         ):
-            return True
+            return False
+    return True
 
-    future = _preloading.get(song)
-    if future:
-        return await future
-    _preloading[song] = asyncio.Future()
 
-    try:
-        preloaded = await load_song(song.webpage_url)
-    except SongError:
-        success = False
+async def _finish_preload(
+    song: Song,
+    preloaded: Union[None, Song, List[Song], Exception],
+    bot: MusicBot,
+) -> Optional[bool]:
+    if isinstance(preloaded, (TemporarySongError, WorkerError)):
+        success = None
     else:
-        success = preloaded is not None
+        success = preloaded is not None and not isinstance(
+            preloaded, Exception
+        )
 
     if success:
         song.update(preloaded)
@@ -253,7 +1893,106 @@ async def preload(song: Song, bot: MusicBot) -> bool:
     return success
 
 
-async def _run_sync(f, *args):
-    return await asyncio.get_running_loop().run_in_executor(
-        _executor, f, *args
+async def load_song_stream(
+    track: str,
+    priority: Priority = Priority.INTERACTIVE,
+    guild: Optional[int] = None,
+) -> AsyncIterator[Union[Song, List[Song]]]:
+    """Same as load_song, but yields playlists in batches as they load
+
+    The first batch has only one song, so it can start playing right away.
+    Single songs (including one-item playlists) are yielded as is"""
+    if _resolves_natively(identify_url(track)) or not may_be_playlist(track):
+        result = await load_song(track, priority, guild)
+        for batch in _batches(_as_list(result)):
+            yield batch
+        return
+
+    key = canonicalize(track)
+    error = _recent_failure(key)
+    if error is not None:
+        raise error
+    job = _Job(_load_song_stream, (track,), get_site(track), guild, priority)
+    job.stream = asyncio.Queue()
+    job.future.add_done_callback(lambda _: job.stream.put_nowait(job))
+    _scheduler.submit(job)
+    try:
+        # the job itself marks the end of the stream
+        host = _song_host(track)
+        while (batch := await job.stream.get()) is not job:
+            yield _to_songs(host, batch)
+        try:
+            job.future.result()
+        except SongError as e:
+            if not job.streamed:
+                _remember_failure(key, e)
+            raise
+    finally:
+        _scheduler.cancel(job)
+        # stops the worker if nobody reads the rest
+        job.future.cancel()
+
+
+def _promote(track: str, priority: Priority):
+    flight = _flights.get(("load", canonicalize(track)))
+    if flight is not None:
+        flight.promote(priority)
+
+
+async def _run_sync(
+    f,
+    *args,
+    site: str,
+    guild: Optional[int] = None,
+    priority: Priority = Priority.INTERACTIVE,
+    flight: Optional[_Flight] = None,
+):
+    job = _Job(f, args, site, guild, priority, (flight,) if flight else ())
+    _scheduler.submit(job)
+    jobs = [job]
+    try:
+        if config.HEDGE_EXTRACTIONS:
+            hedge = await _hedge(job)
+            if hedge is not None:
+                jobs.append(hedge)
+        done, _ = await asyncio.wait(
+            [job.future for job in jobs], return_when=asyncio.FIRST_COMPLETED
+        )
+        return done.pop().result()
+    finally:
+        for job in jobs:
+            _scheduler.cancel(job)
+            # frees the worker slot and tells the worker
+            job.future.cancel()
+
+
+async def _hedge(job: _Job) -> Optional[_Job]:
+    """Sends a copy of the job to another worker when possible
+    if it runs longer than 95% of recent jobs of the same site"""
+    global _hedges
+    p95 = _p95(job.site)
+    if p95 is None:
+        return None
+    await asyncio.wait(
+        [job.future, job.started], return_when=asyncio.FIRST_COMPLETED
+    )
+    if job.future.done():
+        return None
+    await asyncio.wait(
+        [job.future], timeout=p95 - (monotonic() - job.started_at)
     )
+    if job.future.done():
+        return None
+    hedge = _Job(job.f, job.args, job.site, job.guild, job.priority)
+    hedge.flights = job.flights
+    hedge.avoid = job.worker
+    _scheduler.submit(hedge)
+    _hedges += 1
+    return hedge
+
+
+def _p95(site: str) -> Optional[float]:
+    samples = _latencies.get(site)
+    if not samples or len(samples) < MIN_LATENCY_SAMPLES:
+        return None
+    return sorted(samples)[int(len(samples) * 0.95)]
@@ -1,11 +1,14 @@
 import random
-from typing import Optional
+from itertools import islice
 from collections import deque
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 
 from discord import Embed
 
 from config import config
-from musicbot.song import Song
+from musicbot.song import Song, SongInfo
+from musicbot.settings import SavedPlaylist
+from musicbot.linkutils import SiteTypes, get_site_type
 from musicbot.utils import StrEnum, songs_embed
 
 
@@ -21,13 +24,74 @@ class PlaylistError(Exception):
     pass
 
 
+# how many songs to create at once from a PlaylistCursor
+EXPAND_WINDOW = 25
+
+
+class PlaylistCursor:
+    """Unexpanded rest of a playlist, stands for `len(self)` songs in queue
+
+    Keeps SongInfo of each entry without the stream url, which expires,
+    songs are created a window at a time as the queue head gets near"""
+
+    def __init__(
+        self,
+        entries: Iterable[SongInfo],
+        host: Optional[SiteTypes] = None,
+        playlist: Optional[SavedPlaylist] = None,
+    ):
+        self.entries: deque[SongInfo] = deque(entries)
+        # None means detecting from the url of each entry
+        self.host = host
+        self.playlist = playlist
+
+    @classmethod
+    def from_songs(cls, songs: List[Song]) -> "PlaylistCursor":
+        hosts = {song.host for song in songs}
+        return cls(
+            (
+                SongInfo(
+                    song.webpage_url,
+                    title=song.title,
+                    uploader=song.uploader,
+                    duration=song.duration,
+                    thumbnail=song.thumbnail,
+                )
+                for song in songs
+            ),
+            hosts.pop() if len(hosts) == 1 else None,
+        )
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _song(self, entry: SongInfo) -> Song:
+        return Song(
+            self.host or get_site_type(entry.webpage_url),
+            **entry._asdict(),
+            playlist=self.playlist,
+        )
+
+    def take(self, count: int) -> List[Song]:
+        """Removes and returns the first `count` songs"""
+        count = min(count, len(self.entries))
+        return [self._song(self.entries.popleft()) for _ in range(count)]
+
+    def take_last(self) -> Song:
+        return self._song(self.entries.pop())
+
+    def can_merge(self, other: "PlaylistCursor") -> bool:
+        return self.host == other.host and self.playlist is other.playlist
+
+
 class Playlist:
     """Stores the youtube links of songs to be played and already played
     Offers basic operation on the queues"""
 
     def __init__(self):
         # Stores the links os the songs in queue and the ones already played
-        self.playque: deque[Song] = deque()
+        # long playlists are kept in queue as PlaylistCursor
+        self.playque: deque[Union[Song, PlaylistCursor]] = deque()
         self.playhistory: deque[Song] = deque()
 
         # A seperate history that remembers
@@ -37,31 +101,75 @@ class Playlist:
         self.loop = LoopMode.OFF
 
     def __len__(self):
-        return len(self.playque)
+        return sum(
+            len(item) if isinstance(item, PlaylistCursor) else 1
+            for item in self.playque
+        )
 
     def __bool__(self) -> bool:
         return bool(self.playque)
 
     def __getitem__(self, key: int) -> Song:
+        length = len(self)
+        if key < 0:
+            key += length
+        if not 0 <= key < length:
+            # don't expand cursors for nothing
+            raise IndexError("playlist index out of range")
+        self._expand(key + 1)
         return self.playque[key]
 
+    def _expand(self, count: int):
+        """Makes sure that the first `count` items in queue are songs"""
+        i = 0
+        while i < count and i < len(self.playque):
+            cursor = self.playque[i]
+            if not isinstance(cursor, PlaylistCursor):
+                i += 1
+                continue
+            songs = cursor.take(max(count - i, EXPAND_WINDOW))
+            self.playque.rotate(-i)
+            if not cursor:
+                self.playque.popleft()
+            self.playque.extendleft(reversed(songs))
+            self.playque.rotate(i)
+            i += len(songs)
+
+    def head(self, count: int) -> List[Song]:
+        """Returns up to `count` songs from the start of the queue"""
+        self._expand(count)
+        return list(islice(self.playque, count))
+
+    def entries(self) -> Iterator[Tuple[str, Optional[str]]]:
+        """Yields url and title of every song in queue"""
+        for item in self.playque:
+            if isinstance(item, PlaylistCursor):
+                for entry in item.entries:
+                    yield entry.webpage_url, entry.title
+            else:
+                yield item.webpage_url, item.title
+
     def add_name(self, trackname: str):
         self.trackname_history.append(trackname)
         if len(self.trackname_history) > config.MAX_TRACKNAME_HISTORY_LENGTH:
             self.trackname_history.popleft()
 
-    def add(self, track: Song):
+    def add(self, track: Union[Song, PlaylistCursor]):
+        if isinstance(track, PlaylistCursor):
+            if not track:
+                return
+            last = self.playque[-1] if self.playque else None
+            if isinstance(last, PlaylistCursor) and last.can_merge(track):
+                last.entries.extend(track.entries)
+                return
         self.playque.append(track)
 
     def has_next(self) -> bool:
-        return len(self.playque) >= (2 if self.loop != LoopMode.ALL else 1)
+        return len(self) >= (2 if self.loop != LoopMode.ALL else 1)
 
     def has_prev(self) -> bool:
-        return (
-            len(
-                self.playhistory if self.loop != LoopMode.ALL else self.playque
-            )
-            != 0
+        return bool(
+            self.playhistory if self.loop != LoopMode.ALL else self.playque
         )
 
     def next(self, ignore_single_loop=False) -> Optional[Song]:
@@ -75,14 +183,14 @@ class Playlist:
             if len(self.playhistory) > config.MAX_HISTORY_LENGTH:
                 self.playhistory.popleft()
             if len(self.playque) != 0:
-                return self.playque[0]
+                return self[0]
             else:
                 return None
 
         if self.loop == LoopMode.ALL:
             self.playque.rotate(-1)
 
-        return self.playque[0]
+        return self[0]
 
     def prev(self) -> Optional[Song]:
         if self.loop != LoopMode.ALL:
@@ -96,18 +204,42 @@ class Playlist:
         if len(self.playque) == 0:
             return None
 
-        self.playque.rotate()
+        last = self.playque[-1]
+        if isinstance(last, PlaylistCursor):
+            song = last.take_last()
+            if not last:
+                self.playque.pop()
+            self.playque.appendleft(song)
+        else:
+            self.playque.rotate()
 
         return self.playque[0]
 
     def shuffle(self):
-        first = self.playque.popleft()
-        random.shuffle(self.playque)
+        first = self[0]
+        self.playque.popleft()
+        # cursor entries get mixed with the songs one by one,
+        # consecutive ones are put back into cursors afterwards
+        items = []
+        for item in self.playque:
+            if isinstance(item, PlaylistCursor):
+                items.extend((item, entry) for entry in item.entries)
+            else:
+                items.append(item)
+        random.shuffle(items)
+        self.playque.clear()
+        for item in items:
+            if isinstance(item, Song):
+                self.playque.append(item)
+            else:
+                cursor, entry = item
+                self.add(PlaylistCursor([entry], cursor.host, cursor.playlist))
         self.playque.appendleft(first)
 
     def clear(self):
         if self.playque:
-            first = self.playque.popleft()
+            first = self[0]
+            self.playque.popleft()
             self.playque.clear()
             self.playque.appendleft(first)
 
@@ -119,7 +251,7 @@ class Playlist:
         if index == 0:
             raise PlaylistError(PlaylistErrorText.ZERO_INDEX)
         try:
-            return self.playque[index]
+            return self[index]
         except IndexError as e:
             raise PlaylistError(PlaylistErrorText.MISSING_INDEX) from e
 
@@ -140,6 +272,6 @@ class Playlist:
 
     def queue_embed(self) -> Embed:
         return songs_embed(
-            config.QUEUE_TITLE.format(tracks_number=len(self.playque)),
-            list(self.playque)[: config.MAX_SONG_PRELOAD],
+            config.QUEUE_TITLE.format(tracks_number=len(self)),
+            self.head(config.MAX_SONG_PRELOAD),
         )
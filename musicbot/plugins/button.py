@@ -91,8 +91,7 @@ class Button(commands.Cog):
                 audiocontroller.command_channel = serv.get_channel(
                     int(sett.command_channel)
                 )
-            for url in links:
-                await audiocontroller.process_song(url)
+            await audiocontroller.process_songs(links)
 
 
 async def setup(bot: MusicBot):
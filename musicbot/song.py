@@ -1,6 +1,6 @@
 from __future__ import annotations
 import datetime
-from typing import TYPE_CHECKING, Optional, Union
+from typing import TYPE_CHECKING, NamedTuple, Optional, Union
 
 import discord
 
@@ -11,6 +11,40 @@ if TYPE_CHECKING:
     from musicbot.settings import SavedPlaylist
 
 
+class SongInfo(NamedTuple):
+    """Song fields sent from loader processes,
+    without the rest of what yt-dlp extracts"""
+
+    webpage_url: str
+    url: Optional[str] = None
+    title: Optional[str] = None
+    uploader: Optional[str] = None
+    duration: Optional[int] = None
+    thumbnail: Optional[str] = None
+
+    @classmethod
+    def from_data(cls, data: dict, webpage_url: str) -> "SongInfo":
+        """Takes info of an extracted song"""
+        thumbnails = data.get("thumbnails")
+        return cls(
+            data.get("webpage_url") or webpage_url,
+            data.get("url"),
+            data.get("title"),
+            data.get("uploader"),
+            data.get("duration"),
+            # last thumbnail has the best resolution
+            thumbnails[-1]["url"] if thumbnails else data.get("thumbnail"),
+        )
+
+    @classmethod
+    def from_entry(cls, entry: dict) -> "SongInfo":
+        """Takes info of a playlist entry or a search result,
+        their url is the page of the song"""
+        return cls.from_data(
+            {**entry, "url": None, "webpage_url": None}, entry["url"]
+        )
+
+
 class Song:
     def __init__(
         self,
@@ -32,6 +66,10 @@ class Song:
         self.thumbnail = thumbnail
         self.playlist = playlist
 
+    @classmethod
+    def from_info(cls, host: SiteTypes, info: SongInfo) -> "Song":
+        return cls(host, **info._asdict())
+
     def format_output(self, playtype: str) -> discord.Embed:
         embed = discord.Embed(
             title=playtype,
@@ -60,9 +98,11 @@ class Song:
 
         return embed
 
-    def update(self, data: Union[dict, "Song"]):
+    def update(self, data: Union[dict, SongInfo, "Song"]):
         if isinstance(data, Song):
             data = data.__dict__
+        elif isinstance(data, SongInfo):
+            data = data._asdict()
 
         thumbnails = data.get("thumbnails")
         if thumbnails:
@@ -1,10 +1,8 @@
 import re
 
-from yt_dlp.utils import DownloadError
+from yt_dlp.utils import ExtractorError
 from yt_dlp.extractor.common import InfoExtractor
 
-from config import config
-
 
 class DiscordAttachmentsIE(InfoExtractor):
     _VALID_URL = (
@@ -12,23 +10,15 @@ class DiscordAttachmentsIE(InfoExtractor):
         r"/channels/(?P<guild_id>\d+)/(?P<channel_id>\d+)/(?P<message_id>\d+)"
     )
 
-    def _real_extract(self, url):
-        from musicbot.__main__ import bot
-        from musicbot.loader import _loop
-
-        if bot.http.token is None:
-            _loop.run_until_complete(bot.http.static_login(config.BOT_TOKEN))
-
-        match = re.match(self._VALID_URL, url)
-        try:
-            resp = _loop.run_until_complete(
-                bot.http.get_message(
-                    int(match.group("channel_id")),
-                    int(match.group("message_id")),
-                )
-            )
-        except Exception as e:
-            raise DownloadError(str(e)) from e
+    @classmethod
+    async def resolve(cls, url, bot):
+        """Loads the attachments on the bot's event loop,
+        see musicbot.loader"""
+        match = re.match(cls._VALID_URL, url)
+        resp = await bot.http.get_message(
+            int(match.group("channel_id")),
+            int(match.group("message_id")),
+        )
         uploader = resp["author"]["username"]
         entries = [
             {
@@ -40,3 +30,8 @@ class DiscordAttachmentsIE(InfoExtractor):
             for a in resp["attachments"]
         ]
         return {"_type": "playlist", "entries": entries}
+
+    def _real_extract(self, url):
+        raise ExtractorError(
+            "Discord attachments are loaded by the bot", expected=True
+        )
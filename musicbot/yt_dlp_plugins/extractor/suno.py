@@ -1,24 +1,25 @@
 import re
 
-from yt_dlp.utils import DownloadError
+from yt_dlp.utils import ExtractorError
 from yt_dlp.extractor.common import InfoExtractor
 
 
 class SunoAIIE(InfoExtractor):
     _VALID_URL = r"^https?://(app\.suno\.ai|suno\.com)/song/(?P<code>\w+)"
 
-    def _real_extract(self, url):
-        from musicbot.loader import _loop
-        from musicbot.linkutils import get_soup
+    @classmethod
+    async def resolve(cls, url, bot):
+        """Loads the song on the bot's event loop, see musicbot.loader"""
+        from musicbot.linkutils import get_meta
+
+        match = re.match(cls._VALID_URL, url)
+        page = await get_meta(url)
+        return {
+            "id": match.group("code"),
+            "url": page.meta["og:audio"][0],
+            "title": re.sub(r" \| Suno$", "", page.title),
+            "thumbnail": page.get("og:image"),
+        }
 
-        match = re.match(self._VALID_URL, url)
-        try:
-            soup = _loop.run_until_complete(get_soup(url))
-            return {
-                "id": match.group("code"),
-                "url": soup.find(property="og:audio")["content"],
-                "title": re.sub(r" \| Suno$", "", soup.find("title").string),
-                "thumbnail": soup.find(property="og:image")["content"],
-            }
-        except Exception as e:
-            raise DownloadError(str(e)) from e
+    def _real_extract(self, url):
+        raise ExtractorError("Suno songs are loaded by the bot", expected=True)